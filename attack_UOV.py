@@ -1,22 +1,39 @@
 import numpy as np
-import matplotlib.pyplot as plt
 import re
-from sage.all import *
 import random
 import sys
+import os
 import time
 import argparse
-from sage.doctest.util import Timer
-from sage.misc.sage_timeit import SageTimeitResult
-
-def init_globals():
-    """Initialize all global variables for the UOV attack"""
+import multiprocessing
+import queue
+import json
+
+import gf256
+import public_key
+import profiling
+
+# records the stages of a run, enabled from the command line (--profile-report)
+profiler = profiling.StageProfiler(enabled=False)
+
+# Importing sage.all takes seconds, so it is only done once a code path needs Sage
+# (the Sage names used by this module are made module globals)
+def import_sage():
+    global sage_imported, GF, ZZ, PolynomialRing, Matrix, vector, zero_vector, identity_matrix, ideal, version
+    if globals().get("sage_imported"):
+        return
+    from sage.all import GF, ZZ, PolynomialRing, Matrix, vector, zero_vector, identity_matrix, ideal, version
+    sage_imported = True
+
+def init_globals(vinegar=68, oil=44, field=True):
+    """Initialize all global variables for the UOV attack (default: parameters of keys/pk.h)
+    The field and polynomial ring need Sage and are only set up if `field` is set (see init_field)"""
     global v, m, n, q, fixed, K, F, R, x
     
     # number of vinegar variables
-    v = 68
+    v = vinegar
     # number of oil variables = number of public key equations in UOV
-    m = 44
+    m = oil
     # total number of variables
     n = m + v
     # field size q
@@ -24,147 +41,170 @@ def init_globals():
     
     # constant needed for the KS attack
     fixed = 3*m - n
+
+    K = F = R = x = None
+    if field:
+        K, F, R, x = init_field()
+    
+    return v, m, n, q, fixed, K, F, R, x
+
+def init_field():
+    """Import Sage and set up the field K of UOV and the polynomial ring R"""
+    global K, F, R, x, field_to_int
+    import_sage()
     
     # define the field that is used in UOV
     F = GF(2)['y']
     (y,) = F._first_ngens(1)
     K = GF(q, 'z', modulus=y**8 + y**4 + y**3 + y + 1, repr='int', proof=False, names=('z',))
     (z,) = K._first_ngens(1)
+
+    # byte representation of every field element (see VectorToBytes)
+    field_to_int = {K(ZZ(b).digits(base=2)): b for b in range(q)}
     
     # Define polynomial ring
     R = PolynomialRing(K, 'x', v, order='degrevlex')
     x = R.gens()
+
+    profiler.info.update(sage=version())
     
-    return v, m, n, q, fixed, K, F, R, x
+    return K, F, R, x
 
 
 ############################################
 ##### Kipnis-Shamir attack
 
-def FindOilKipnisShamir(m, matrices_sym, matrices, var_change):
-    R = PolynomialRing(K,'x', n, order='degrevlex')
-    flag_found=True
-    trial=0 
-    while flag_found:
-        M0=matrices_sym[0]
-        M1=matrices_sym[1]
-        flag_inv=True
-        while flag_inv:
-            for j in range(1,m):
-                M0 += K.random_element()*matrices_sym[j]
-                M1 += K.random_element()*matrices_sym[j]
-            if M0.is_invertible():
-                flag_inv=False
-        M=M0.inverse()*M1
-        pol= M.charpoly()
-        P=pol.factor()
-        for i in range(len(P)-1,-1,-1):
-            P1=list(P)[i]
-            PP=P1[0]
-            PP_coef = list(PP) 
-            I=identity_matrix(K, n-m-fixed)
-            PP_M=PP_coef[0]*I
-            for ii in range(1,len(PP_coef)):
-                PP_M+=PP_coef[ii]*M**ii
-            PP_M_Ker=PP_M.right_kernel()
-            basis=PP_M_Ker.basis_matrix()
-            check=Eval(matrices,Matrix(R,1,n-m-fixed,[basis[0,i] for i in range(n-m-fixed)]),Matrix(R,1,n-m-fixed,[basis[0,i] for i in range(n-m-fixed)]))
-            flag1=0 
-            for i in range(m):
-                if check[i][0] == 0:
-                    flag1+=1
-            if flag1 == m:
-                flag_found=False
-                oil1=var_change*Matrix(K,n-m-fixed,1,[basis[0,i] for i in range(n-m-fixed)])
+# one randomized trial: pick a random pair of combinations M0, M1 of the restricted forms,
+# factor the characteristic polynomial of M0^-1*M1 and test the kernels of its factors.
+# Returns the oil vector (n x 1) found in this trial or None
+def TrialKipnisShamir(matrices_sym, matrices_tensor, var_change, rng):
+    M0=matrices_sym[0]
+    M1=matrices_sym[1]
+    flag_inv=True
+    while flag_inv:
+        for j in range(1,m):
+            M0 += IntToField(rng.randrange(q))*matrices_sym[j]
+            M1 += IntToField(rng.randrange(q))*matrices_sym[j]
+        if M0.is_invertible():
+            flag_inv=False
+    M=M0.inverse()*M1
+    pol= M.charpoly()
+    P=pol.factor()
+    for i in range(len(P)-1,-1,-1):
+        P1=list(P)[i]
+        PP=P1[0]
+        PP_coef = list(PP) 
+        I=identity_matrix(K, n-m-fixed)
+        PP_M=PP_coef[0]*I
+        for ii in range(1,len(PP_coef)):
+            PP_M+=PP_coef[ii]*M**ii
+        PP_M_Ker=PP_M.right_kernel()
+        basis=PP_M_Ker.basis_matrix()
+        if gf256.is_oil(matrices_tensor, VectorToBytes(basis[0])):
+            return var_change*Matrix(K,n-m-fixed,1,[basis[0,i] for i in range(n-m-fixed)])
+    return None
+
+# trial t of a run with base seed `seed` draws its combinations from Random(seed + t)
+def FindOilKipnisShamir(m, matrices_sym, matrices, var_change, workers=1, seed=None):
+    matrices_tensor = MatricesToTensor(matrices)
+    if seed is None:
+        seed = random.randrange(2**32)
+    print(f"Kipnis-Shamir seed: {seed}")
+
+    if workers == 1:
+        trial = 0
+        oil1 = None
+        while oil1 is None:
+            oil1 = TrialKipnisShamir(matrices_sym, matrices_tensor, var_change, random.Random(seed + trial))
+            trial += 1
+        print(f"Oil vector found in trial {trial - 1}")
+        return oil1.transpose()
+
+    trial, oil_bytes = ParallelTrialsKipnisShamir(matrices_sym, matrices_tensor, var_change, workers, seed)
+    print(f"Oil vector found in trial {trial}")
+    return Matrix(K, 1, n, [IntToField(b) for b in oil_bytes])
+
+# next result of worker processes, polling the queue every `poll` seconds. Raises once
+# every worker has exited (e.g. killed by the OOM killer) instead of blocking forever
+def _GetWorkerResult(results, processes, poll, name):
+    while True:
+        try:
+            return results.get(timeout=poll)
+        except queue.Empty:
+            if not any(p.is_alive() for p in processes):
                 break
-        trial+=1
-    return oil1.transpose()
+    # a worker may have put its last result right before exiting
+    try:
+        return results.get(timeout=poll)
+    except queue.Empty:
+        raise RuntimeError(f"all {name} workers exited without a result (exit codes {[p.exitcode for p in processes]})") from None
+
+# worker side of ParallelTrialsKipnisShamir, inputs are inherited from the parent by fork.
+# Every worker draws trial numbers from the shared counter and reports successful trials
+# (and its own failure) on the result queue until it is terminated
+def _TrialWorker(matrices_sym, matrices_tensor, var_change, seed, counter, results):
+    trial = None
+    try:
+        while True:
+            with counter.get_lock():
+                trial = counter.value
+                counter.value += 1
+            oil1 = TrialKipnisShamir(matrices_sym, matrices_tensor, var_change, random.Random(seed + trial))
+            if oil1 is not None:
+                results.put((trial, bytes(VectorToBytes(oil1.column(0)))))
+    except Exception as e:
+        # Sage exceptions do not necessarily pickle
+        results.put(RuntimeError(f"Kipnis-Shamir trial {trial} failed: {e!r}"))
+
+# run independent trials in worker processes (None workers = all cores) and return
+# (trial, oil vector bytes) of the first successful one. The workers are terminated as
+# soon as a trial succeeds, which cancels the trials still running. A worker killed from
+# outside only loses its current trial, once every worker is gone an error is raised
+def ParallelTrialsKipnisShamir(matrices_sym, matrices_tensor, var_change, workers, seed, poll=1.0):
+    ctx = multiprocessing.get_context("fork")
+    counter = ctx.Value("q", 0)
+    results = ctx.Queue()
+    processes = [ctx.Process(target=_TrialWorker, args=(matrices_sym, matrices_tensor, var_change, seed, counter, results), daemon=True)
+                 for _ in range(workers or os.cpu_count())]
+    for p in processes:
+        p.start()
+    try:
+        result = _GetWorkerResult(results, processes, poll, "Kipnis-Shamir")
+        if isinstance(result, BaseException):
+            raise result
+        return result
+    finally:
+        for p in processes:
+            p.terminate()
+        for p in processes:
+            p.join()
 
 #############################################
 ##### Prep for Kipnis-Shamir attack #################
 
-# find the linear relations
-def InitialLinSystemKS(a_full, PublicKeySymm, x, fixed):
-    R = PolynomialRing(K,'x', n, order='degrevlex')
-    systemM=[]
-    system=[x[n-m-i] for i in range(fixed,0,-1)] 
-    # linear equations
-    systemM = Eval(PublicKeySymm,Matrix(R,1,n,a_full[0]), Matrix(R,1,n,a_full[1]))
-    for j in range(len(systemM)):
-        system+=systemM[j][0]
-    Arev=LinearSystemToMatrixReversed(system,n,m+fixed)
-    Areduced=Arev.echelon_form()
-    xrev = x
-    xrev.reverse()
-    xrev_short = []
-    for jj in range(m+fixed):
-        xrev_short+=[xrev[jj]]
-    partial_sol=Areduced*Matrix(R,n,1,xrev)+Matrix(R,m+fixed,1,xrev_short)
-    x.reverse()
-    full_sol=[x[i] for i in range(n-m-fixed)]+[partial_sol[i,0] for i in range(m-1+fixed,-1,-1)]
-    return full_sol
-
-# find matrix form of linear system in reversed order
-def LinearSystemToMatrixReversed(system,n,m):
-    R = PolynomialRing(K,'x', n, order='degrevlex')
-    x = list(R.gens())
-    A=Matrix(K,m,n)
-    for i in range(len(system)):
-        temp=system[i]
-        coefs=temp.coefficients()
-        monoms=temp.monomials()
-        for j in range(n):
-            for l in range(len(monoms)):
-                if monoms[l] == x[j]:
-                    A[i,n-j-1]=coefs[l]
-    return A
-
-# find matrix form of linear system
-def LinearSystemToMatrix(system,n,m):
-    R = PolynomialRing(K,'x', n, order='degrevlex')
-    x = list(R.gens())	        
-    A=Matrix(K,m,n)
-    for i in range(len(system)):
-        temp=system[i]
-        coefs=temp.coefficients()
-        monoms=temp.monomials()
-        for j in range(n):
-            for l in range(len(monoms)):
-                if monoms[l] == x[j]:
-                    A[i,j]=coefs[l]
-    return A
-
-# form the system 
-def InitialSystemKS(a_full, PublicKey):
-    systemM=[]
-    system=[]
-    for j in range(0,len(a_full)):
-        systemM += Eval(PublicKey,Matrix(R,1,n,a_full[j]), Matrix(R,1,n,a_full[j]))
-    for j in range(len(systemM)):
-        system+=systemM[j][0]
-    return system
-
-# find coefficient matrices
-def PolynomialToMatrix(system,k):
-    R = PolynomialRing(K,'x', n, order='degrevlex')
-    x = list(R.gens())
-    system_matrices=[]
-    system_matrices_sym=[]
-    for i in range(len(system)):
-        M=Matrix(K,k,k)
-        temp=system[i]
-        coefs=temp.coefficients()
-        monoms=temp.monomials()
-        for j1 in range(k):
-            for j2 in range(j1,k):
-                for l in range(len(monoms)):
-                    if monoms[l] == x[j1]*x[j2]:
-                        M[j1,j2]=coefs[l]
-        system_matrices+=[M]
-        system_matrices_sym+=[M+M.transpose()]
-    return system_matrices, system_matrices_sym
+# find the linear relations o*S_k*x = 0 (together with x_i = 0 for the fixed variables)
+# and solve them for the last m+fixed variables in terms of the first n-m-fixed ones.
+# Returns the substitution matrix V (n x (n-m-fixed)) with x = V*y
+def VarChangeKS(oil, PublicKeySymm):
+    k = n-m-fixed
+    oil = vector(K, oil)
+    L = Matrix(K, [oil*S for S in PublicKeySymm])
+    L = L.stack(Matrix(K, fixed, n, lambda i, j: 1 if j == k+i else 0))
+    # L[:, :k]*y + L[:, k:]*x_last = 0  (characteristic 2, no signs)
+    x_last = L[:, k:].solve_right(L[:, :k])
+    return identity_matrix(K, k).stack(x_last)
+
+# restrict the public forms to the image of the substitution matrix
+# The coefficient matrices V^T*P_k*V are not folded to upper triangular form,
+# y*M*y^T is the same quadratic form either way
+def RestrictedFormsKS(var_change, PublicKey, PublicKeySymm):
+    var_change_T = var_change.transpose()
+    matrices = [var_change_T*M*var_change for M in PublicKey]
+    matrices_sym = [var_change_T*M*var_change for M in PublicKeySymm]
+    return matrices, matrices_sym
 
 # need to check check_vin function
+# P is the (m, n, n) uint8 public key tensor, see MatricesToTensor
 def check_vin(vin,P,sig):
     oil = zero_vector(K,n)
     for i in range(n):
@@ -172,214 +212,366 @@ def check_vin(vin,P,sig):
             oil[i] = sig[i] + vin[i]
         else:
             oil[i] = sig[i]
-    # check evaluation
-    eval = zero_vector(K,m)
-    for i in range(m):
-        eval[i]=oil*P[i]*oil   
-        if (eval[i] != 0):
-            print("BADDDDDD")
-            return 0
+    # check evaluation of all m forms at once
+    if not gf256.is_oil(P, VectorToBytes(oil)):
+        print("BADDDDDD")
+        return 0
     print("goooooooooood")
     return oil
 
+# P is the (m, n, n) uint8 public key tensor, see MatricesToTensor
 def check_oil(oil_in,P):
     oil = zero_vector(K,n)
     for i in range(n):
             oil[i] = oil_in[i]
-    # check evaluation
-    eval = zero_vector(K,m)
-    for i in range(m):          
-        eval[i]=oil*P[i]*oil             
-        if (eval[i] != 0):
-            return 0
+    # check evaluation of all m forms at once
+    if not gf256.is_oil(P, VectorToBytes(oil)):
+        return 0
     return oil
 
 
-def ReplaceWithSCAoil(a_full,recoveredOil):
-    for i in range(len(recoveredOil)):
-        a_full[i]=recoveredOil[i]
-
+# load the public key as (m, n, n) uint8 tensor of upper triangular matrices
+# use TensorToMatrices to get Sage matrices over K
 def readPK(path):
-    with open(path, 'r') as file:
-        input = file.read()
-    pk = input.split(", ")
-
-    # convert between types of key
-    P1 = pk[:103224]
-    P2 = pk[103224:234872]
-    P3 = pk[234872:]
-   
-    len_old = [2992, 2948, 2904, 2860, 2816, 2772, 2728, 2684, 2640, 2596, 2552, 2508, 2464, 2420, 2376, 2332, 
-               2288, 2244, 2200, 2156, 2112, 2068, 2024, 1980, 1936, 1892, 1848, 1804, 1760, 1716, 1672, 1628, 
-               1584, 1540, 1496, 1452, 1408, 1364, 1320, 1276, 1232, 1188, 1144, 1100, 1056, 1012, 968, 924, 880, 
-               836, 792, 748, 704, 660, 616, 572, 528, 484, 440, 396, 352, 308, 264, 220, 176, 132, 88, 44]
-    
-    interleaved = []
-    summe = 0
-    for i, x in enumerate(len_old):
-        interleaved.append(P1[summe:summe+x])
-        interleaved.append(P2[i*1936:(i+1)*1936])
-        summe = summe + x
-
-    interleaved.append(P3)
-
-    # to flat the key
-    pk = [x for sub in interleaved for x in sub]
-
-    ######################################
-    # sort PK to matrices                #
-    ######################################
-    P = [zero_matrix(K,n,n) for _ in range(m)]
-    t = 0
-    # sort P1array to matrices
-    for i in range(n):
-        for j in range (i,n):
-            for k in range(m):
-                P[k][i,j]=K(ZZ(int(pk[t],16)).digits(base=2))
-                t = t+1         
-    return P  
+    return public_key.load_pk(path, v, m)
 
 ######################################
 ##### helper #########################
 
-def SplitInto_k(L, k):
-    l = len(L)
-    m = l // k # the length of the sublists
-    return [list(L[i*m:(i+1)*m]) for i in range(k)]
-
-def AppendIndependent(L, k, first_index):
-    l = len(L)
-    aug_list = [[0 for j in range(k)]+L[i] for i in range(l)]
-    for i in range(l):
-        aug_list[i][i + first_index]=1
-    return aug_list
-
-# insert the found lin relations into the vectors		
-def InsertLinEq(a_full,sol_full):
-    temp = a_full[len(a_full)-1]
-    for i in range(m,n):
-        temp[i]=sol_full[i-m]
-    a_full[len(a_full)-1] = temp
-
-# insert the lin solutions in the list of vars to be used in the quad. system
-def InsertFound(solution,vector_vars):
-    for i in range(0,v-m):
-        vector_vars[n-m-i-1] = solution[i]
-
-# turn random matrix to upper diagonal
-def RandomToUpper(M):
-    n = M.ncols()
-    retM = M
-    for i in range(n):
-        for j in range(i+1,n):
-            retM[i,j] += retM[j,i]
-            retM[j,i] = K(0) 
-    return retM
-            
-# turn upper diagonal matrix to symmetric
-def UpperToSymmetric(M):
-    return M+M.transpose() 
+# convert between field elements and their byte representation
+def IntToField(b):
+    return K(ZZ(b).digits(base=2))
+
+def VectorToBytes(vec):
+    return np.array([field_to_int[K(e)] for e in vec], dtype=np.uint8)
+
+def BytesToVector(b):
+    return vector(K, [IntToField(c) for c in b])
+
+# convert a list of matrices over K to a (len(P), rows, cols) uint8 tensor for gf256
+def MatricesToTensor(P):
+    return np.array([[[field_to_int[e] for e in row] for row in M.rows()] for M in P], dtype=np.uint8)
+
+# convert a (len(P), rows, cols) uint8 tensor to a list of matrices over K
+def TensorToMatrices(P):
+    elements = [IntToField(b) for b in range(q)]
+    return [Matrix(K, M.shape[0], M.shape[1], [elements[b] for b in M.ravel().tolist()]) for M in P]
 
 # evaluate Multivariate map 
 def Eval(F,x,y):
     return [ x*M*(y.transpose()) for M in F]
 
-def Evalleft(F,x):
-    return [ x*M for M in F]
-
 #############################################
 ##### Reconciliation attack #################
 
-# find the linear relations
-def InitialLinSystem(a_full, PublicKeySymm, known):
-    R = PolynomialRing(K,'x', v, order='degrevlex')
-    systemM=[]
-    # linear equations
-    k = len(a_full)-1
-    for j in range(len(a_full)-1):
-        systemM += Evalleft(PublicKeySymm,Matrix(R,1,n,a_full[j]))
-    A=Matrix(R,1,n,systemM[0])
-    for i in range(1,len(systemM)):
-        A=A.stack(vector(systemM[i])) 
-    listvars=list([i for i in range(m,n)])
-    listvars.reverse()
-    Asmall = A[[i for i in range(len(systemM))],listvars+list([w])]
-    reducedAsmall=Asmall.echelon_form()
-    reversed_a_full=list([a_full[k][i] for i in range(m,n)])
-    reversed_a_full.reverse()
-    vector_vars=vector(reversed_a_full+list([a_full[k][w]]))
-    partial_sol=reducedAsmall*vector_vars-vector([x[i] for i in range(v-1,v-m-1,-1)]) 
-    full_sol=[x[i] for i in range(v-m)]+[partial_sol[i] for i in range(m-1,-1,-1)]
-    return full_sol, reducedAsmall, vector_vars
-
-# form the system 
-def InitialSystem(a_full, PublicKey, PublicKeySymm, known):
-    systemM=[]
-    system=[]
-    # linear equations
-    for j in range(len(a_full)):
-        for k in range(max(known,j+1),len(a_full)):
-            systemM += Eval(PublicKeySymm,Matrix(R,1,n,a_full[j]), Matrix(R,1,n,a_full[k]))
-    # quadratic equations
-    for j in range(known,len(a_full)):
-        systemM += Eval(PublicKey,Matrix(R,1,n,a_full[j]), Matrix(R,1,n,a_full[j]))
-    for j in range(len(systemM)):
-        system+=systemM[j][0]
-    return system
+# The unknown oil vector a = c + T*y with y = (x_0, ..., x_{v-1}) is stored as affine
+# coefficient matrix [T | c] (n x (v+1)) over GF(256): the first m coordinates are
+# the unit vector e_index, the last v coordinates are the unknowns
+def UnknownOilVector(index):
+    coeffs = np.zeros((n, v+1), dtype=np.uint8)
+    coeffs[m:, :v] = np.identity(v, dtype=np.uint8)
+    coeffs[index, v] = 1
+    return coeffs
+
+# symbolic vector over R for an affine coefficient matrix
+def AffineToPolynomials(coeffs):
+    T = TensorToMatrices([coeffs[:, :v]])[0]
+    c = vector(K, [IntToField(b) for b in coeffs[:, v]])
+    return T*vector(R, x[:v]) + c
+
+# products o*S_k of a known oil vector with all symmetric public matrices, (m x n)
+# The rows of all known vectors span the linear constraints o*S_k*a = 0 on a new vector
+def BilinearRows(PublicKeySymm, oil):
+    return gf256.xor_sum(gf256.MUL[oil[None, :, None], PublicKeySymm], axis=1)
+
+# form the linear equations o_j*S_k*a = 0 for all known vectors as A*y = b
+# constraints is the EchelonBasis of all BilinearRows, so its size stays <= n - m
+def InitialSystem(constraints, coeffs):
+    M = gf256.matmul(constraints.rows, coeffs)
+    # characteristic 2: A*y + c = 0  <=>  A*y = c
+    return M[:, :v], M[:, v]
 
 # solve the system 
-def SolveSystem(system, recoveredOil, w):
-    I=ideal(system)
-    gr=I.groebner_basis()
-
-    solution_full=[]
-    solution_split=[]
-    temp_recoveredOil = recoveredOil
-    if len(gr)==v:
-        solution=[x[i]-gr[i] for i in range(v)]
-
-        solution_split = SplitInto_k(solution, 1)
-        solution_full=AppendIndependent(solution_split, m, w + found)
-        temp_recoveredOil += solution_full
-
+# The linear equations are solved by Gaussian elimination. If they determine the new
+# vector uniquely no Groebner basis is needed, otherwise the linear equations and
+# the quadratic equations a*P_k*a^T = 0 are passed to the Groebner engine.
+# Returns the new oil vector as bytes (or None) and the path taken ("linear" or "groebner")
+def SolveSystem(A, b, coeffs, PK, PK_tensor):
+    affine = gf256.solve_affine(A, b)
+    profiler.record(equations=A.shape[0], unknowns=A.shape[1], free_variables=None if affine is None else len(affine[1]))
+
+    solution=None
+    if affine is None:
+        path = "linear"
+        print("SolveSystem: linear part inconsistent")
+    elif len(affine[1]) == 0:
+        path = "linear"
+        print(f"SolveSystem: linear ({len(A)} linear equations, unique solution)")
+        solution=affine[0]
     else:
+        path = "groebner"
+        print(f"SolveSystem: groebner ({len(affine[1])} free variables after linear part)")
+        a_poly = Matrix(R, 1, n, AffineToPolynomials(coeffs))
+        system = list(TensorToMatrices([A])[0]*vector(R, x[:v]) + vector(K, [IntToField(c) for c in b]))
+        system += [M[0,0] for M in Eval(PK, a_poly, a_poly)]
+        gr=ideal(system).groebner_basis()
+        profiler.record(groebner_basis_length=len(gr))
+        if len(gr)==v:
+            solution=np.array([field_to_int[K((x[i]-gr[i]).constant_coefficient())] for i in range(v)], dtype=np.uint8)
+
+    profiler.record(path=path)
+
+    oil=None
+    if solution is not None:
+        oil = gf256.matvec(coeffs, np.append(solution, 1))
+        # the quadratic equations have to vanish as well
+        if not gf256.is_oil(PK_tensor, oil):
+            oil=None
+
+    if oil is None:
         print("NO oil vectors found")
-        if len(gr)==1:
+        if affine is None or (path == "groebner" and len(gr)==1):
             print("Needs randomization")
         else:
             print("Needs more vectors")
-    return solution_full,solution_split,temp_recoveredOil
-
-def KipnisShamir(R, Oilspace, PK):
-    print("starting InitialLinSystemKS ...")
-    start = time.time()
-    sol_full = InitialLinSystemKS([Oilspace] + [list(R.gens())], [UpperToSymmetric(j) for j in PK], list(R.gens()), fixed)
-    print(f"Time: {time.time() - start:.2f}s")
-
-    print("starting LinearSystemToMatrix ...")
-    start = time.time()
-    var_change = LinearSystemToMatrix(sol_full,n-m-fixed,n)
-    print(f"Time: {time.time() - start:.2f}s")
+    return oil,path
 
-    print("starting InitialSystemKS ...")
+def KipnisShamir(R, Oilspace, PK, PKSymm, workers=1, seed=None):
+    print("starting VarChangeKS ...")
     start = time.time()
-    system = InitialSystemKS([sol_full], PK)
+    with profiler.stage("VarChangeKS"):
+        var_change = VarChangeKS(Oilspace, PKSymm)
     print(f"Time: {time.time() - start:.2f}s")
 
-    print("starting PolynomialToMatrix ...")
+    print("starting RestrictedFormsKS ...")
     start = time.time()
-    matrices, matrices_sym=PolynomialToMatrix(system,n-m-fixed)
+    with profiler.stage("RestrictedFormsKS"):
+        matrices, matrices_sym = RestrictedFormsKS(var_change, PK, PKSymm)
     print(f"Time: {time.time() - start:.2f}s")
 
     print("starting FindOilKipnisShamir ...")
     start = time.time()    
-    foundoil = FindOilKipnisShamir(m, matrices_sym, matrices, var_change)
+    with profiler.stage("FindOilKipnisShamir", workers=workers, seed=seed):
+        foundoil = FindOilKipnisShamir(m, matrices_sym, matrices, var_change, workers, seed)
     print(f"Time: {time.time() - start:.2f}s")
 
     Oilspace = [Oilspace] + [[foundoil[0][i] for i in range(n)]]
 
     return Oilspace
 
+DEFAULT_CHECKPOINT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "build", "checkpoints")
+
+# write the recovered oil vectors (bytes) to the checkpoint file, atomically
+def SaveCheckpoint(path, pk_hash, stage, Oilspace):
+    state = {
+        "pk_hash": pk_hash,
+        "v": v,
+        "m": m,
+        "stage": stage,
+        "w": w,
+        "found": len(Oilspace) - w,
+        "oilspace": [bytes(oil).hex() for oil in Oilspace],
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+# read the oil vectors of a checkpoint, keeping the longest prefix of vectors that
+# are independent and vanish on the public key (the last consistent state).
+# Returns the vectors, the number w of vectors the reconciliation started from and the
+# stage of the checkpoint (None and no vectors if there is nothing usable to resume)
+def LoadCheckpoint(path, pk_hash, PK_tensor):
+    try:
+        with open(path, "r") as f:
+            state = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"No usable checkpoint at {path}: {e}")
+        return [], 2, None
+
+    fields = {"pk_hash": str, "v": int, "m": int, "stage": str, "w": int, "oilspace": list}
+    if not isinstance(state, dict) or any(not isinstance(state.get(key), kind) for key, kind in fields.items()):
+        print(f"Checkpoint {path} is incomplete, starting from scratch")
+        return [], 2, None
+
+    if state["pk_hash"] != pk_hash or state["v"] != v or state["m"] != m:
+        print(f"Checkpoint {path} belongs to a different public key, ignoring it")
+        return [], 2, None
+
+    Oilspace = []
+    basis = gf256.EchelonBasis(n)
+    for oil_hex in state["oilspace"]:
+        try:
+            oil = np.frombuffer(bytes.fromhex(oil_hex), dtype=np.uint8)
+        except (TypeError, ValueError):
+            oil = None
+        if oil is None or len(oil) != n or not gf256.is_oil(PK_tensor, oil) or not basis.add(oil):
+            print(f"Checkpoint vector {len(Oilspace)} is invalid, discarding it and all later ones")
+            break
+        Oilspace.append(oil)
+
+    print(f"Resuming from checkpoint {path} ({state['stage']}, {len(Oilspace)} oil vectors)")
+    if not Oilspace:
+        return [], 2, None
+    return Oilspace, max(2, min(state["w"], len(Oilspace))), state["stage"]
+
+# run Kipnis-Shamir (if only one oil vector is known) and the reconciliation on the
+# known oil vectors (bytes). Returns the full basis or None if the reconciliation fails.
+# The state is written to the checkpoint after every stage (None = no checkpoint)
+def RecoverOilspace(Oilspace, PK, PKSymm, PK_tensor, PKSymm_tensor, pk_hash, checkpoint, ks_workers=1, seed=None):
+    global found
+
+    Oilspace = list(Oilspace)
+    if len(Oilspace) < 2:
+        # Kipnis-Shamir attack
+        with profiler.stage("KipnisShamir"):
+            Oilspace = KipnisShamir(R, BytesToVector(Oilspace[0]), PK, PKSymm, ks_workers, seed)
+            Oilspace = [VectorToBytes(oil) for oil in Oilspace]
+        if checkpoint is not None:
+            SaveCheckpoint(checkpoint, pk_hash, "kipnis-shamir", Oilspace)
+
+    found = len(Oilspace) - w
+
+    # The oil space projects bijectively onto the first m coordinates, so the pivots of
+    # the known vectors lie there. The missing basis vectors are the ones projecting to
+    # the unit vectors e_i of all other coordinates i < m
+    basis = gf256.EchelonBasis(n)
+    basis.extend(np.array(Oilspace))
+    missing = [i for i in range(m) if i not in basis.pivots]
+
+    # linear constraints the known oil vectors put on new vectors
+    constraints = gf256.EchelonBasis(n)
+    for oil in Oilspace:
+        constraints.extend(BilinearRows(PKSymm_tensor, oil))
+
+    print("starting loop ...")
+    count = 0
+    for index in missing:
+        if len(Oilspace) == m:
+            break
+        print(str(count) + " starting SolveSystem ...")
+        start = time.time()
+        with profiler.stage("SolveSystem", iteration=count, index=index, known=len(Oilspace)):
+            coeffs = UnknownOilVector(index)
+            A, b = InitialSystem(constraints, coeffs)
+            oil,path = SolveSystem(A, b, coeffs, PK, PK_tensor)
+        print(f"Time: {time.time() - start:.2f}s")    
+
+        count = count + 1
+        if oil is None:
+            # the system is deterministic, retrying would give the same result
+            return None
+
+        # only the products of the newest vector have to be computed
+        Oilspace.append(oil)
+        constraints.extend(BilinearRows(PKSymm_tensor, oil))
+        found += 1
+        if checkpoint is not None:
+            SaveCheckpoint(checkpoint, pk_hash, "reconciliation", Oilspace)
+
+    return Oilspace
+
+# worker side of ParallelRecoverCandidates, inputs are inherited from the parent by fork.
+# Every worker draws candidate indices from the shared counter until all are taken.
+# A candidate whose recovery raises (e.g. a degenerate one) counts as failed
+def _RecoveryWorker(candidates, PK, PKSymm, PK_tensor, PKSymm_tensor, counter, results):
+    while True:
+        with counter.get_lock():
+            index = counter.value
+            counter.value += 1
+        if index >= len(candidates):
+            return
+        try:
+            # the Kipnis-Shamir trials of a fallback run sequentially, the workers are already parallel
+            Oilspace = RecoverOilspace([candidates[index]], PK, PKSymm, PK_tensor, PKSymm_tensor, None, None, ks_workers=1)
+        except Exception as e:
+            print(f"Recovery from fallback candidate {index + 1} failed: {e!r}")
+            Oilspace = None
+        results.put((index, None if Oilspace is None else [bytes(o) for o in Oilspace]))
+
+# attempt the recovery from every candidate in worker processes (None workers = all cores)
+# and return (index, basis) of the first successful one, (None, None) if all fail.
+# The workers are terminated as soon as one candidate succeeds. If workers die, their
+# candidates are lost and an error is raised once every worker is gone
+def ParallelRecoverCandidates(candidates, PK, PKSymm, PK_tensor, PKSymm_tensor, workers=None, poll=1.0):
+    ctx = multiprocessing.get_context("fork")
+    counter = ctx.Value("q", 0)
+    results = ctx.Queue()
+    processes = [ctx.Process(target=_RecoveryWorker, args=(candidates, PK, PKSymm, PK_tensor, PKSymm_tensor, counter, results), daemon=True)
+                 for _ in range(min(workers or os.cpu_count(), len(candidates)))]
+    for p in processes:
+        p.start()
+    try:
+        for _ in range(len(candidates)):
+            index, Oilspace = _GetWorkerResult(results, processes, poll, "recovery")
+            if Oilspace is not None:
+                return index, [np.frombuffer(o, dtype=np.uint8) for o in Oilspace]
+        return None, None
+    finally:
+        for p in processes:
+            p.terminate()
+        for p in processes:
+            p.join()
+
+# read oil candidates from a file, a log of attack_target.py or stdin ("-").
+# Accepts `OIL CANDIDATE[i]: <hex>` lines as well as lines holding only a hex vector.
+# Duplicates are dropped, the order of first occurrence is kept
+def ReadCandidates(source):
+    if source == "-":
+        lines = sys.stdin.readlines()
+    else:
+        with open(source, "r") as f:
+            lines = f.readlines()
+
+    candidates = {}
+    for line in lines:
+        match = re.search(r"OIL CANDIDATE\[\d+\]:\s*([0-9a-fA-F]+)", line)
+        if line.startswith("{"):
+            # shot record of a result log of attack_target.py (result_log.py)
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            hex_data = (record.get("data") or {}).get("oil") if record.get("type") == "shot" else None
+            if hex_data is None:
+                continue
+        elif match is not None:
+            hex_data = match.group(1)
+        elif re.fullmatch(r"\s*[0-9a-fA-F]+\s*", line):
+            hex_data = line.strip()
+        else:
+            continue
+        if len(hex_data) != 2*n:
+            continue
+        candidates.setdefault(bytes.fromhex(hex_data), None)
+
+    print(f"Read {len(candidates)} unique candidates from {source}")
+    return [np.frombuffer(c, dtype=np.uint8) for c in candidates]
+
+# keep the candidates that are independent of the previous ones (incremental echelon basis)
+def AssembleSpan(candidates):
+    basis = gf256.EchelonBasis(n)
+    Oilspace = []
+    for oil in candidates:
+        if basis.add(oil):
+            Oilspace.append(oil)
+            if basis.rank == m:
+                break
+    print(f"Valid candidates span an oil subspace of dimension {basis.rank}")
+    return Oilspace
+
+# check all candidates against the public key, returns the valid ones. The bit-sliced
+# map rejects almost every invalid candidate after its first form (as in attack_target.py)
+def ScreenCandidates(candidates, PK_tensor):
+    if len(candidates) == 0:
+        return []
+    valid = gf256.QuadraticMap(PK_tensor).is_oil_batch(np.array(candidates))
+    print(f"{int(valid.sum())} of {len(candidates)} candidates are valid oil vectors")
+    return [c for c, ok in zip(candidates, valid) if ok]
+
 def load_hex_data(input_str):
     """Load hex data from file or direct hex string"""
     # Check if input is a file path
@@ -400,7 +592,7 @@ def load_hex_data(input_str):
     # Convert hex to list of field elements
     try:
         data = list(bytes.fromhex(hex_data))
-        data = [K(ZZ(x).digits(base=2)) for x in data]
+        data = [IntToField(x) for x in data]
     except ValueError as e:
         print(f"Error: Invalid hex data: {e}")
         sys.exit(1)
@@ -408,82 +600,121 @@ def load_hex_data(input_str):
     return data
 
 
-def main(pk_path, oil_hex):
+def main(pk_path, oil_hex, cache=None, ks_workers=1, seed=None, checkpoint=None, resume=False, candidates=None, candidate_workers=None, span=False):
     """
     Main function to run UOV attack
     
     Args:
         pk_path: Path to public key file
         oil_hex: Oil vector ~ faulty signature as hex string
+        cache: PublicKeyCache for derived public key structures (None to disable)
+        ks_workers: Number of processes for Kipnis-Shamir trials (None = all cores)
+        seed: Base seed for the Kipnis-Shamir trials (None = random)
+        checkpoint: Path of the checkpoint file (None = per key file in build/checkpoints)
+        resume: Continue from the checkpoint instead of starting over
+        candidates: File with oil candidates (e.g. attack log, "-" = stdin), replaces oil_hex
+        candidate_workers: Number of processes trying fallback candidates (None = all cores)
+        span: Use all independent valid candidates as basis vectors (skips Kipnis-Shamir for >= 2)
     
     Returns:
         Recovered oil space basis
     """
 
-    global v, m, n, q, fixed, K, F, R, x, found, w
+    global v, m, n, q, fixed, K, F, R, x, w
     
     # Initialize global variables
-    v, m, n, q, fixed, K, F, R, x = init_globals()
+    # Sage is set up (init_field) only once a path needs it
+    v, m, n, q, fixed, K, F, R, x = init_globals(field=False)
     
-    # Load OIL vector
-    print(f"Loading faulty signature ...")
-    OIL = load_hex_data(oil_hex)
-
     # Load public key
-    print(f"Loading public key from: {args.pk}")
-    PK = readPK(args.pk)    
-    
-    # optional validation
-    Oilspace = check_oil(OIL, PK)
-    if Oilspace == 0:
-        print("ERROR: Invalid oil vector")
-        return None
-    print("Oil vector verified successfully!")
-
-    R = PolynomialRing(K,'x', n, order='degrevlex')
-
-    # Kipnis-Shamir attack
-    Oilspace = KipnisShamir(R, Oilspace, PK)
+    print(f"Loading public key from: {pk_path}")
+    with profiler.stage("load_pk", cached=cache is not None):
+        if cache is not None:
+            PK_tensor, PKSymm_tensor = cache.load(pk_path, v, m)
+        else:
+            PK_tensor = readPK(pk_path)
+            PKSymm_tensor = public_key.upper_to_symmetric(PK_tensor)
+        pk_hash = public_key.tensor_hash(PK_tensor)
+    profiler.info.update(pk=pk_path, pk_hash=pk_hash)
+    if checkpoint is None:
+        checkpoint = os.path.join(DEFAULT_CHECKPOINT_DIR, f"{pk_hash[:16]}.json")
 
     w = 2
-    found = 0
 
-    # start the reconciliation part
-    x = R.gens()
-
-    a=SplitInto_k([x[i] for i in range(v)], 1)
-
-    solution_split=[[Oilspace[0][i] for i in range(m,n)],[Oilspace[1][i] for i in range(m,n)]]
-
-    print("starting loop ...")
-    count = 0
-    while found < m-w:
-        a_aug = solution_split + a
-
-        print(str(count) + " starting SolveSystem ...")
-        start = time.time()
-        a_full=AppendIndependent(a_aug, m, 0)
-        ReplaceWithSCAoil(a_full,Oilspace)
-        system = InitialSystem(a_full, PK, [UpperToSymmetric(j) for j in PK],w+found)
-        solution_full,solution_split_found,Oilspace = SolveSystem(system, Oilspace, w)
-        print(f"Time: {time.time() - start:.2f}s")    
+    # known oil vectors as bytes
+    Oilspace = []
+    valid = []
+    stage = None
+    if resume:
+        Oilspace, w, stage = LoadCheckpoint(checkpoint, pk_hash, PK_tensor)
+
+    if not Oilspace and candidates is not None:
+        # batch mode: screen all candidates, start from the first valid one
+        with profiler.stage("check_oil", candidates=candidates):
+            valid = ScreenCandidates(ReadCandidates(candidates), PK_tensor)
+        if len(valid) == 0:
+            print("ERROR: No valid oil vector among the candidates")
+            return None
+        if span:
+            # every independent valid candidate is a free basis vector
+            Oilspace = AssembleSpan(valid)
+            w = max(2, len(Oilspace))
+        else:
+            Oilspace = [valid[0]]
+
+    if not Oilspace:
+        if oil_hex is None:
+            print("ERROR: No oil vector given and nothing to resume")
+            return None
+
+        K, F, R, x = init_field()
+
+        # Load OIL vector
+        print("Loading faulty signature ...")
+        OIL = load_hex_data(oil_hex)
+
+        # optional validation
+        with profiler.stage("check_oil"):
+            oil = check_oil(OIL, PK_tensor)
+        if oil == 0:
+            print("ERROR: Invalid oil vector")
+            return None
+        print("Oil vector verified successfully!")
+        Oilspace = [VectorToBytes(oil)]
+
+    if len(Oilspace) == m:
+        print("Oil space complete, no solving needed")
+        # a resumed checkpoint keeps the stage it was completed in
+        if stage is None:
+            SaveCheckpoint(checkpoint, pk_hash, "span", Oilspace)
+    else:
+        # Sage matrices are only needed from here on
+        if K is None:
+            K, F, R, x = init_field()
+        with profiler.stage("TensorToMatrices"):
+            PK = TensorToMatrices(PK_tensor)
+            PKSymm = TensorToMatrices(PKSymm_tensor)
+
+        R = PolynomialRing(K,'x', n, order='degrevlex')
+        x = R.gens()
+
+        Oilspace = RecoverOilspace(Oilspace, PK, PKSymm, PK_tensor, PKSymm_tensor, pk_hash, checkpoint, ks_workers, seed)
+
+        if Oilspace is None and candidates is not None and not span and len(valid) > 1:
+            print(f"Recovery from the first candidate failed, trying {len(valid) - 1} fallback candidates ...")
+            index, Oilspace = ParallelRecoverCandidates(valid[1:], PK, PKSymm, PK_tensor, PKSymm_tensor, candidate_workers)
+            if Oilspace is not None:
+                print(f"Recovered from fallback candidate {index + 1}")
+                SaveCheckpoint(checkpoint, pk_hash, "reconciliation", Oilspace)
+
+    if Oilspace is None:
+        return None
 
-        count = count + 1
-        solution_split += solution_split_found
-        
-        found += len(solution_full)
-    
+    with profiler.stage("final_conversion"):
+        basis = [[int(b) for b in Oilspace[i]] for i in range(m)]
     print('\nThe following is a basis of the secret Oilspace.\n')
-    # Convert Oilspace entries from polynomial to integer representation for output
-    for i in range(w,m):
-        for j in range(m,n):
-            if not (Oilspace[i][j].coefficients()):
-                Oilspace[i][j] = 0
-            else:
-                Oilspace[i][j] = Oilspace[i][j].coefficients()[0]        
-    
     for i in range(m):    
-        print(Oilspace[i])   
+        print(basis[i])   
 
     return True
 
@@ -491,12 +722,36 @@ def main(pk_path, oil_hex):
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='UOV Key Recovery Attack')
     parser.add_argument('--pk', required=True, help='Path to public key file')
-    parser.add_argument('--oil', required=True, help='Oil vector ~ faulty signature (hex string)')
+    parser.add_argument('--oil', help='Oil vector ~ faulty signature (hex string), optional with --resume')
+    parser.add_argument('--cache-dir', default=public_key.DEFAULT_CACHE_DIR, help='Directory for cached public key structures')
+    parser.add_argument('--cache-max-mb', type=int, default=512, help='Size limit of the public key cache in MB (least recently used keys are evicted)')
+    parser.add_argument('--no-cache', action='store_true', help='Do not use the public key cache')
+    parser.add_argument('--invalidate-cache', action='store_true', help='Clear the public key cache before running')
+    parser.add_argument('--ks-workers', type=int, default=1, help='Number of processes running Kipnis-Shamir trials in parallel (0 = all cores)')
+    parser.add_argument('--seed', type=int, default=None, help='Base seed for the randomized Kipnis-Shamir trials')
+    parser.add_argument('--checkpoint', default=None, help='Checkpoint file written after every stage (default: build/checkpoints/<key hash>.json)')
+    parser.add_argument('--resume', action='store_true', help='Resume from the checkpoint')
+    parser.add_argument('--candidates', default=None, help='File, attack log or result log with oil candidates ("-" = stdin), used instead of --oil')
+    parser.add_argument('--candidate-workers', type=int, default=0, help='Number of processes trying fallback candidates (0 = all cores)')
+    parser.add_argument('--span', action='store_true', help='With --candidates: use all independent valid candidates as oil space basis vectors')
+    parser.add_argument('--profile-report', default=None, help='Write wall time, CPU time and memory of every stage to this JSON file')
+    parser.add_argument('--trace-memory', action='store_true', help='Record per-stage peak memory with tracemalloc (slower)')
+    parser.add_argument('--cprofile', action='append', default=[], metavar='STAGE', help='Run a stage (e.g. FindOilKipnisShamir, SolveSystem or "all") under cProfile, repeatable')
+    parser.add_argument('--cprofile-dir', default='build/profiles', help='Directory for the cProfile .prof files')
 
     args = parser.parse_args()
+
+    cache = None
+    if not args.no_cache:
+        cache = public_key.PublicKeyCache(args.cache_dir, args.cache_max_mb * 2**20)
+        if args.invalidate_cache:
+            cache.invalidate()
     
+    if args.profile_report is not None or args.cprofile:
+        profiler = profiling.StageProfiler(trace_memory=args.trace_memory, cprofile_stages=args.cprofile, cprofile_dir=args.cprofile_dir)
+
     startTime = time.time()
-    result = main(args.pk, args.oil)    
+    result = main(args.pk, args.oil, cache, args.ks_workers or None, args.seed, args.checkpoint, args.resume, args.candidates, args.candidate_workers or None, args.span)    
     endTime = time.time()
 
     if result:
@@ -504,4 +759,9 @@ if __name__ == "__main__":
     else:
         print("\nAttack failed!")
 
-    print(f"Total execution time:  {endTime - startTime:.2f}s")         
\ No newline at end of file
+    print(f"Total execution time:  {endTime - startTime:.2f}s")
+
+    if args.profile_report is not None:
+        profiler.info.update(result=bool(result), total_s=endTime - startTime)
+        profiler.write(args.profile_report)
+        print(f"Profile report written to {args.profile_report}")         
\ No newline at end of file
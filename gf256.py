@@ -0,0 +1,393 @@
+import numpy as np
+
+
+# Field used by UOV: GF(2)[y] / (y^8 + y^4 + y^3 + y + 1), elements stored as bytes
+# with bit i holding the coefficient of y^i (same convention as K(ZZ(x).digits(base=2))).
+MODULUS = 0x11B
+GENERATOR = 0x03
+
+
+def _build_tables():
+    exp = np.zeros(512, dtype=np.uint8)
+    log = np.zeros(256, dtype=np.int16)
+    a = 1
+    for i in range(255):
+        exp[i] = a
+        log[a] = i
+        # multiply by the generator y + 1
+        a ^= (a << 1) ^ (MODULUS if a & 0x80 else 0)
+    # duplicate so that EXP[LOG[a] + LOG[b]] never needs a modulo
+    exp[255:510] = exp[:255]
+
+    mul = exp[log[:, None] + log[None, :]]
+    mul[0, :] = 0
+    mul[:, 0] = 0
+
+    inv = np.zeros(256, dtype=np.uint8)
+    inv[1:] = exp[255 - log[1:]]
+    return exp, log, mul, inv
+
+
+EXP, LOG, MUL, INV = _build_tables()
+
+
+def mul(a, b):
+    """
+    Element-wise multiplication in GF(256).
+
+    Args:
+        a, b (array_like): uint8 arrays (broadcastable) or ints
+
+    Returns:
+        np.ndarray: Products a*b
+    """
+    return MUL[np.asarray(a, dtype=np.uint8), np.asarray(b, dtype=np.uint8)]
+
+
+def inv(a):
+    """
+    Element-wise inverse in GF(256). The inverse of 0 is returned as 0.
+    """
+    return INV[np.asarray(a, dtype=np.uint8)]
+
+
+def xor_sum(a, axis=None):
+    """
+    Sum (XOR) of field elements along an axis.
+    """
+    return np.bitwise_xor.reduce(a, axis=axis)
+
+
+def matvec(A, x):
+    """
+    Matrix-vector product A*x over GF(256).
+
+    Args:
+        A (np.ndarray): (..., r, c) uint8 matrices
+        x (np.ndarray): (c,) uint8 vector
+
+    Returns:
+        np.ndarray: (..., r) product
+    """
+    return xor_sum(MUL[A, x], axis=-1)
+
+
+def matmul(A, B):
+    """
+    Matrix product A*B over GF(256).
+
+    Args:
+        A (np.ndarray): (r, k) uint8 matrix
+        B (np.ndarray): (k, c) uint8 matrix
+
+    Returns:
+        np.ndarray: (r, c) product
+    """
+    A = np.asarray(A, dtype=np.uint8)
+    B = np.asarray(B, dtype=np.uint8)
+    out = np.zeros((A.shape[0], B.shape[1]), dtype=np.uint8)
+    for k in range(A.shape[1]):
+        out ^= MUL[A[:, k, None], B[None, k, :]]
+    return out
+
+
+def eval_bilinear(P, x, y):
+    """
+    Evaluate the forms x^T * P_k * y for all k at once.
+
+    Args:
+        P (np.ndarray): (m, n, n) uint8 tensor of m matrices
+        x (np.ndarray): (n,) uint8 vector
+        y (np.ndarray): (n,) uint8 vector
+
+    Returns:
+        np.ndarray: (m,) uint8 values
+    """
+    x = np.asarray(x, dtype=np.uint8)
+    y = np.asarray(y, dtype=np.uint8)
+    outer = MUL[x[:, None], y[None, :]]
+    return xor_sum(MUL[P, outer].reshape(P.shape[0], -1), axis=1)
+
+
+def eval_quadratic(P, x):
+    """
+    Evaluate the quadratic forms x^T * P_k * x for all k at once.
+
+    Args:
+        P (np.ndarray): (m, n, n) uint8 tensor of m matrices
+        x (np.ndarray): (n,) uint8 vector
+
+    Returns:
+        np.ndarray: (m,) uint8 values
+    """
+    return eval_bilinear(P, x, x)
+
+
+def eval_quadratic_batch(P, X, chunk_size=16):
+    """
+    Evaluate the quadratic forms x^T * P_k * x for all k and a batch of vectors.
+
+    Vectors are processed in chunks to bound the size of the (chunk, m, n, n)
+    intermediate tensor.
+
+    Args:
+        P (np.ndarray): (m, n, n) uint8 tensor of m matrices
+        X (np.ndarray): (B, n) uint8 vectors
+        chunk_size (int): Number of vectors contracted at once
+
+    Returns:
+        np.ndarray: (B, m) uint8 values
+    """
+    X = np.atleast_2d(np.asarray(X, dtype=np.uint8))
+    m = P.shape[0]
+    out = np.empty((X.shape[0], m), dtype=np.uint8)
+    for start in range(0, X.shape[0], chunk_size):
+        chunk = X[start:start + chunk_size]
+        outer = MUL[chunk[:, :, None], chunk[:, None, :]]
+        prod = MUL[P[None, :, :, :], outer[:, None, :, :]]
+        out[start:start + chunk_size] = xor_sum(prod.reshape(len(chunk), m, -1), axis=2)
+    return out
+
+
+def is_oil(P, x):
+    """
+    Check whether x vanishes on all public quadratic forms.
+
+    Args:
+        P (np.ndarray): (m, n, n) uint8 public key tensor
+        x (np.ndarray): (n,) uint8 vector
+
+    Returns:
+        bool: True if P_k(x) == 0 for all k
+    """
+    return not eval_quadratic(P, x).any()
+
+
+def is_oil_batch(P, X):
+    """
+    Check a batch of vectors against all public quadratic forms.
+
+    Returns:
+        np.ndarray: (B,) bool, True where P_k(x) == 0 for all k
+    """
+    return ~eval_quadratic_batch(P, X).any(axis=1)
+
+
+def rref(A):
+    """
+    Reduced row echelon form over GF(256) (Gaussian elimination).
+
+    Args:
+        A (np.ndarray): (r, c) uint8 matrix
+
+    Returns:
+        tuple: (R, pivots) with R the (rank, c) reduced row echelon form and
+               pivots the list of pivot columns
+    """
+    R = np.array(A, dtype=np.uint8)
+    pivots = []
+    r = 0
+    for c in range(R.shape[1]):
+        if r == R.shape[0]:
+            break
+        nonzero = np.flatnonzero(R[r:, c])
+        if len(nonzero) == 0:
+            continue
+        p = r + nonzero[0]
+        if p != r:
+            R[[r, p]] = R[[p, r]]
+        R[r] = MUL[INV[R[r, c]], R[r]]
+
+        # eliminate column c from all other rows
+        others = np.flatnonzero(R[:, c])
+        others = others[others != r]
+        R[others] ^= MUL[R[others, c, None], R[r][None, :]]
+        pivots.append(c)
+        r += 1
+    return R[:r], pivots
+
+
+def solve_affine(A, b):
+    """
+    Solve A*x = b over GF(256).
+
+    Args:
+        A (np.ndarray): (r, c) uint8 matrix
+        b (np.ndarray): (r,) uint8 vector
+
+    Returns:
+        tuple | None: (x0, N) with x0 a particular (c,) solution and N the (c - rank, c)
+                      basis of the kernel of A, so that all solutions are x0 + t*N.
+                      None if the system is inconsistent.
+    """
+    A = np.asarray(A, dtype=np.uint8)
+    cols = A.shape[1]
+    R, pivots = rref(np.hstack([A, np.asarray(b, dtype=np.uint8).reshape(-1, 1)]))
+    if pivots and pivots[-1] == cols:
+        return None
+
+    x0 = np.zeros(cols, dtype=np.uint8)
+    x0[pivots] = R[:, cols]
+
+    free = [c for c in range(cols) if c not in set(pivots)]
+    N = np.zeros((len(free), cols), dtype=np.uint8)
+    for i, f in enumerate(free):
+        N[i, f] = 1
+        # characteristic 2: -R = R
+        N[i, pivots] = R[:, f]
+    return x0, N
+
+
+class EchelonBasis:
+    """
+    Incrementally maintained reduced row echelon basis of a subspace of GF(256)^n.
+    """
+
+    def __init__(self, n):
+        self.n = n
+        self.rows = np.zeros((0, n), dtype=np.uint8)
+        self.pivots = []
+
+    @property
+    def rank(self):
+        return len(self.pivots)
+
+    def reduce(self, x):
+        """
+        Reduce x against the basis. The result is zero iff x lies in the span.
+        """
+        x = np.array(x, dtype=np.uint8)
+        if self.rank:
+            # rows are reduced: row i is 1 at its own pivot and 0 at all other pivots
+            x ^= xor_sum(MUL[x[self.pivots, None], self.rows], axis=0)
+        return x
+
+    def add(self, x):
+        """
+        Add x to the basis.
+
+        Returns:
+            bool: True if x was independent of the basis (rank increased)
+        """
+        r = self.reduce(x)
+        nonzero = np.flatnonzero(r)
+        if len(nonzero) == 0:
+            return False
+        p = nonzero[0]
+        r = MUL[INV[r[p]], r]
+
+        # eliminate the new pivot from the existing rows and insert the row sorted by pivot
+        self.rows ^= MUL[self.rows[:, p, None], r[None, :]]
+        i = int(np.searchsorted(self.pivots, p))
+        self.rows = np.insert(self.rows, i, r, axis=0)
+        self.pivots.insert(i, int(p))
+        return True
+
+    def extend(self, X):
+        """
+        Add all rows of X to the basis.
+
+        Returns:
+            int: Number of independent rows (rank increase)
+        """
+        return sum(self.add(x) for x in np.atleast_2d(X))
+
+
+# parity of every byte
+PARITY = np.array([bin(b).count("1") & 1 for b in range(256)], dtype=np.uint8)
+
+
+class QuadraticMap:
+    """
+    Fixed system of m quadratic forms in n variables, prepared for fast repeated evaluation.
+
+    P_k(x) is the sum of P_k[i, j] * x_i * x_j over i <= j. Multiplication by a
+    constant is GF(2)-linear, so every output bit is the parity of an AND between the
+    bits of the outer product (x_i * x_j)_{i <= j} and a precomputed bit mask. The masks
+    are packed into 64-bit words, making one evaluation a single AND/XOR pass.
+    """
+
+    def __init__(self, P):
+        """
+        Args:
+            P (np.ndarray): (m, n, n) uint8 tensor (lower triangular parts are folded onto the upper)
+        """
+        P = np.asarray(P, dtype=np.uint8)
+        self.m, self.n, _ = P.shape
+        self.rows, self.cols = np.triu_indices(self.n)
+        upper = np.triu(P) ^ np.triu(np.swapaxes(P, 1, 2), 1)
+        coeffs = upper[:, self.rows, self.cols]                      # (m, N)
+
+        # bit b of every product P_kt * o_t is linear in the bits of o_t:
+        # column c of `images` is P_kt * 2^c
+        images = MUL[coeffs[:, :, None], (1 << np.arange(8, dtype=np.uint8))[None, None, :]]  # (m, N, 8)
+        masks = np.unpackbits(images[..., None], axis=-1, bitorder="little")                  # (m, N, 8 [c], 8 [b])
+        masks = masks.transpose(0, 3, 1, 2).reshape(self.m, 8, -1)                           # (m, b, N*8)
+
+        self.words = -(-masks.shape[2] // 64)
+        padded = np.zeros((self.m, 8, self.words * 64), dtype=np.uint8)
+        padded[:, :, :masks.shape[2]] = masks
+        self._masks = np.packbits(padded, axis=-1, bitorder="little").view("<u8")           # (m, 8, words)
+
+    def _outer_words(self, x):
+        x = np.asarray(x, dtype=np.uint8)
+        outer = np.zeros(self.words * 8, dtype=np.uint8)
+        outer[:len(self.rows)] = MUL[x[self.rows], x[self.cols]]
+        return outer.view("<u8")
+
+    def _eval(self, masks, outer):
+        acc = np.bitwise_xor.reduce(masks & outer, axis=-1)                                 # (k, 8)
+        bits = PARITY[np.bitwise_xor.reduce(acc.view(np.uint8).reshape(acc.shape + (8,)), axis=-1)]
+        return np.packbits(bits, axis=-1, bitorder="little").reshape(-1)
+
+    def __call__(self, x):
+        """
+        Evaluate all forms on x.
+
+        Args:
+            x (np.ndarray): (n,) uint8 vector
+
+        Returns:
+            np.ndarray: (m,) uint8 values
+        """
+        return self._eval(self._masks, self._outer_words(x))
+
+    def is_oil(self, x):
+        """
+        Check whether x vanishes on all forms. Non-oil vectors are almost always
+        rejected by the first form alone.
+        """
+        outer = self._outer_words(x)
+        if self._eval(self._masks[:1], outer).any():
+            return False
+        return not self._eval(self._masks[1:], outer).any()
+
+    def is_oil_batch(self, X):
+        """
+        Check a batch of (B, n) vectors, returns (B,) bool.
+        """
+        return np.array([self.is_oil(x) for x in np.atleast_2d(X)], dtype=bool)
+
+    def evaluate_batch(self, X, chunk_size=16):
+        """
+        Evaluate all forms on a batch of vectors. Chunks of vectors are evaluated
+        with one AND/XOR pass over a (chunk, m, 8, words) tensor.
+
+        Args:
+            X (np.ndarray): (B, n) uint8 vectors
+            chunk_size (int): Number of vectors evaluated at once
+
+        Returns:
+            np.ndarray: (B, m) uint8 values
+        """
+        X = np.atleast_2d(np.asarray(X, dtype=np.uint8))
+        out = np.empty((X.shape[0], self.m), dtype=np.uint8)
+        for start in range(0, X.shape[0], chunk_size):
+            chunk = X[start:start + chunk_size]
+            outer = np.zeros((len(chunk), self.words * 8), dtype=np.uint8)
+            outer[:, :len(self.rows)] = MUL[chunk[:, self.rows], chunk[:, self.cols]]
+            outer = outer.view("<u8")
+            acc = np.bitwise_xor.reduce(self._masks[None] & outer[:, None, None, :], axis=-1)  # (chunk, m, 8)
+            bits = PARITY[np.bitwise_xor.reduce(acc.view(np.uint8).reshape(acc.shape + (8,)), axis=-1)]
+            out[start:start + chunk_size] = np.packbits(bits, axis=-1, bitorder="little").reshape(len(chunk), -1)
+        return out
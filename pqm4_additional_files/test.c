@@ -202,6 +202,11 @@ static int test_sign(void)
   clear_trigger();
   #endif
 
+  #ifdef READOUT_SIG
+  // Send only the signature (w || salt) in one packet without acknowledge,
+  // the host knows the message (all zeros unless sent with the start signal)
+  sendpacket('g', sm + MLEN, smlen - MLEN);
+  #else
   // Send `sm` to host (split up in 190 byte chunks)
   for (size_t i = 0; i < smlen; i+=190)
   {
@@ -219,6 +224,7 @@ static int test_sign(void)
   }
 
   send_ack('e'); // Indicates end of data packets
+  #endif
 
   return 0;
 }
@@ -53,6 +53,56 @@ int generate_faulted_sig(unsigned char *m, unsigned char *sm, unsigned char *sal
     return 0;
 }
 
+// Verify `count` contiguous records msg (256 bytes) || sig (OV_SIGNATUREBYTES) in one call.
+// results[i] is 0 if record i is valid, 1 otherwise. Returns the number of invalid records.
+int verify_signatures(const unsigned char *records, size_t count, int *results) {
+    const size_t record_len = 256 + OV_SIGNATUREBYTES;
+    unsigned char m[256];
+    int invalid = 0;
+
+    if (records == NULL || results == NULL) {
+        fprintf(stderr, "Invalid input: records or results is NULL\n");
+        return -1;
+    }
+    for (size_t i = 0; i < count; i++) {
+        unsigned long long mlen = 256;
+        int ret = crypto_sign_open(m, &mlen, records + i * record_len, record_len, pk_comp);
+        results[i] = (ret != 0);
+        invalid += results[i];
+    }
+    return invalid;
+}
+
+// Calculate the expected oil (_PUB_N_BYTE bytes) of `count` contiguous records
+// msg (256 bytes) || sig (OV_SIGNATUREBYTES) in one call, using the salt of every signature.
+// Rows of records whose signing fails are zeroed. Returns the number of failed records.
+int calculate_oils(const unsigned char *records, size_t count, unsigned char *out) {
+    const size_t record_len = 256 + OV_SIGNATUREBYTES;
+    unsigned char sm[256 + OV_SIGNATUREBYTES];
+    unsigned char sig_out[OV_SIGNATUREBYTES];
+    int failed = 0;
+
+    if (records == NULL || out == NULL) {
+        fprintf(stderr, "Invalid input: records or out is NULL\n");
+        return -1;
+    }
+    for (size_t i = 0; i < count; i++) {
+        const unsigned char *msg = records + i * record_len;
+        const unsigned char *sig = msg + 256;
+
+        // message from the record, zeroed out signature
+        memcpy(sm, msg, 256);
+        memset(sm + 256, 0, OV_SIGNATUREBYTES);
+        if (generate_faulted_sig((unsigned char *)msg, sm, (unsigned char *)sig + _PUB_N_BYTE, sig_out) != 0) {
+            memset(out + i * _PUB_N_BYTE, 0, _PUB_N_BYTE);
+            failed++;
+            continue;
+        }
+        memcpy(out + i * _PUB_N_BYTE, sig_out, _PUB_N_BYTE);
+    }
+    return failed;
+}
+
 int main(void)
 {
 }
@@ -1,14 +1,50 @@
 import os
 import sys
+import copy
 import ctypes
+import glob
+import json
+import math
+import random
+import shutil
 
 from chipshouter_profiler.config_classes import GlitchConfig, TargetConfig, SimpleSerialPacket
 from chipshouter_profiler.profile_target import CSProfiler
 
 from chipshouter_profiler.simpleserial.simpleserial import TargetSerial
 from verification_utils import verify_signature, calculate_oil
+import results_table
 
 
+# Result types rewarded by the adaptive scheduler (weight per result type)
+SUCCESS_WEIGHTS = {
+    "profile-counter": {"faults": 1.0},
+    "profile-memcpy": {"faults": 1.0},
+    "profile-attack-memcpy": {"detected_oil": 1.0, "faulted_sig": 0.1},
+    "profile-attack-complete": {"detected_oil": 1.0, "faulted_sig": 0.1},
+}
+
+# Shots an arm needs before it is pruned for crashing on every one of them. A single
+# crash says little about an arm, with fewer shots it is only ranked by its success rate
+PRUNE_MIN_SHOTS = 3
+
+# Message signed by the target, the firmware signs zeros unless a message is sent with the start signal
+MESSAGE = bytes(256)
+
+
+def classify_signature(profilerSelf, parsed_data):
+    result = verify_signature(parsed_data['msg'], parsed_data['sig'])
+    if result == 0: # Signature is correct (no fault occurred)
+        return "nofaults", parsed_data
+    else: # Signature is incorrect (fault occurred)
+        profilerSelf.reset_target()
+        parsed_data["expected_oil"] = calculate_oil(parsed_data["msg"], parsed_data["sig"])
+        parsed_data["actual_oil"] = parsed_data["sig"][:112]
+        if parsed_data["expected_oil"] == parsed_data["actual_oil"]: # Signature includes correct oil
+            return "detected_oil", parsed_data
+        else: # Signature does not include correct oil
+            return "faulted_sig", parsed_data
+
 def attack_data_handler(profilerSelf, packetSelf, data=None):
     profilerSelf.target_serial.send_ack('d')
 
@@ -17,6 +53,7 @@ def attack_data_handler(profilerSelf, packetSelf, data=None):
         try:
             cmd, raw_data = profilerSelf.target_serial.read_packet()
         except Exception as e:
+            print(f"Reading signature chunk failed ({e})")
             result_category, extradata = profilerSelf.crashHandler()
             return result_category, extradata
         else: # if no exception was raised
@@ -38,17 +75,18 @@ def attack_data_handler(profilerSelf, packetSelf, data=None):
     # print(f"MSG (len={len(parsed_data['msg'])}): {parsed_data['msg']}")
     # print(f"SIG (len={len(parsed_data['sig'])}): {parsed_data['sig'].hex()}")
 
-    result = verify_signature(parsed_data['msg'], parsed_data['sig'])
-    if result == 0: # Signature is correct (no fault occurred)
-        return "nofaults", parsed_data
-    else: # Signature is incorrect (fault occurred)
-        profilerSelf.reset_target()
-        parsed_data["expected_oil"] = calculate_oil(parsed_data["msg"], parsed_data["sig"])
-        parsed_data["actual_oil"] = parsed_data["sig"][:112]
-        if parsed_data["expected_oil"] == parsed_data["actual_oil"]: # Signature includes correct oil
-            return "detected_oil", parsed_data
-        else: # Signature does not include correct oil
-            return "faulted_sig", parsed_data
+    return classify_signature(profilerSelf, parsed_data)
+
+def signature_data_handler(profilerSelf, packetSelf, data=None):
+    # Signature-only readout (firmware built with READOUT=sig): the whole signature
+    # arrives in this packet, no acknowledge and no end packet
+    if data is None or len(data) != 128:
+        print(f"ERROR: signature packet with {0 if data is None else len(data)} bytes (expected 128)")
+        result_category, extradata = profilerSelf.crashHandler()
+        return result_category, extradata
+
+    parsed_data = {"msg": MESSAGE, "sig": bytes(data)}
+    return classify_signature(profilerSelf, parsed_data)
 
 def counter_fault_handler(profilerSelf, packetSelf, data=None):
     profilerSelf.reset_target() # TODO when resetting fails, will faults or bricked be written??
@@ -97,6 +135,250 @@ def get_raster_positions(origin, dim_x, dim_y, stepsize_x, stepsize_y):
 
     return positions
 
+def create_profiler(target_config, positions, glitch_configs):
+    """
+    Create a CSProfiler with the handlers and result types of all profiling modes.
+    """
+    profiler = CSProfiler(target_config, positions, glitch_configs)
+    # Profile-counter fault signal. Contains the faulted counter value. Sent only when target detects that counter is not as expected.
+    profiler.addSimpleSerialCommand(SimpleSerialPacket("f", "Fault signal from target with buffer content (fault)", counter_fault_handler), overwrite=True)
+    # Profile-memcpy fault signal. Contains the faulted memcpy buffer (68 bytes). Sent only when target detects that buffer is not as expected.
+    profiler.addSimpleSerialCommand(SimpleSerialPacket("q", "Fault signal from target with buffer content (fault)", memcpy_fault_handler), overwrite=True)
+    # Attack data signal. Contains sm (signature and message). Sent after every signature generation
+    profiler.addSimpleSerialCommand(SimpleSerialPacket("d", "Data from target (signature and message), split up in 190 byte chunks", attack_data_handler), overwrite=True)
+    # Attack signature signal (READOUT=sig firmware). Contains only the signature, sent in one packet without acknowledge
+    profiler.addSimpleSerialCommand(SimpleSerialPacket("g", "Signature from target (w and salt), one packet", signature_data_handler), overwrite=True)
+
+    profiler.addResultType("faulted_sig", "Faulted Signature")
+    profiler.addResultType("detected_oil", "Detected valid OIL")
+    return profiler
+
+def snapshot_results(results_dir):
+    """
+    Modification time and size of every json in `results_dir` (see campaign_results_file).
+    """
+    snapshot = {}
+    for path in glob.glob(os.path.join(results_dir, "*.json")):
+        stat = os.stat(path)
+        snapshot[os.path.abspath(path)] = (stat.st_mtime_ns, stat.st_size)
+    return snapshot
+
+def campaign_results_file(results_dir, before, positions, glitch_configs):
+    """
+    Results file of the campaign that just finished: the only json in `results_dir` created
+    or modified since the snapshot `before`, which has to hold exactly the positions and
+    glitch configs of the campaign.
+
+    Raises:
+        RuntimeError: No such file, more than one, or one holding another campaign
+    """
+    changed = sorted(path for path, stat in snapshot_results(results_dir).items() if before.get(path) != stat)
+    if len(changed) != 1:
+        raise RuntimeError(f"Expected one results file written to {results_dir} by the campaign, found {len(changed)}: {changed} "
+                           "(is it the directory CSProfiler writes to, and is nothing else writing there?)")
+    path = changed[0]
+
+    with open(path, "r") as f:
+        summary = json.load(f)
+    expected = [(c.pulse_offset, c.voltage, c.pulse_width, c.num_executions) for c in glitch_configs]
+    found = [(c.get("pulse_offset"), c.get("voltage"), c.get("pulse_width"), c.get("num_executions")) for c in summary.get("glitch_configs", [])]
+    if summary.get("positions") != [list(p) for p in positions] or found != expected:
+        raise RuntimeError(f"{path} was written during the campaign but holds other positions or glitch configs")
+    return path
+
+def merge_results(round_files, positions, glitch_configs):
+    """
+    Merge the results files of all rounds into one summary over the full grid (same
+    format as a single campaign). Counters and data of an arm are summed over the rounds,
+    `num_executions` is the largest number of executions of the config at any position.
+
+    Args:
+        round_files (list): (path, position indices, config indices) of every campaign
+        positions (list): All positions
+        glitch_configs (list): All glitch configs
+    """
+    merged = {}
+    executions = {}
+    info = None
+    errors = []
+    for path, position_indices, config_indices in round_files:
+        with open(path, "r") as f:
+            summary = json.load(f)
+        info = info or summary.get("Info: glitch_config results structure")
+        errors.extend(summary.get("catched_errors", []))
+        for j, config in enumerate(summary["glitch_configs"]):
+            c = config_indices[j]
+            if c not in merged:
+                merged[c] = ({k: v for k, v in config.items() if k != "results"}, {}, {})
+            _, counters, data = merged[c]
+            for p in position_indices:
+                executions[(c, p)] = executions.get((c, p), 0) + config["num_executions"]
+            for key, value in config["results"].items():
+                if key.startswith("num_"):
+                    column = counters.setdefault(key, [0] * len(positions))
+                    for i, count in enumerate(value):
+                        column[position_indices[i]] += count
+                else:
+                    entries = data.setdefault(key, {})
+                    for entry in value:
+                        entries.setdefault(position_indices[entry["position_index"]], []).extend(entry["data"])
+
+    merged_configs = []
+    for c in sorted(merged):
+        config, counters, data = merged[c]
+        config["num_executions"] = max(n for (config_index, _), n in executions.items() if config_index == c)
+        results = dict(counters)
+        for key, entries in data.items():
+            results[key] = [{"position_index": p, "data": entries[p]} for p in sorted(entries)]
+        config["results"] = results
+        merged_configs.append(config)
+
+    return {
+        "Info: glitch_config results structure": info,
+        "catched_errors": errors,
+        "positions": positions,
+        "glitch_configs": merged_configs,
+    }
+
+def group_campaigns(arms, max_campaigns):
+    """
+    Batch (position index, config index) arms into campaigns over position x config grids.
+
+    Positions with the same configs share one campaign (or configs with the same positions,
+    whichever needs fewer campaigns). As long as there are more than `max_campaigns`, the
+    two campaigns whose merged grid adds the fewest arms are merged; these extra arms are
+    executed as well.
+
+    Returns:
+        list: (position indices, config indices) of every campaign
+    """
+    configs_per_position = {}
+    positions_per_config = {}
+    for p, c in arms:
+        configs_per_position.setdefault(p, []).append(c)
+        positions_per_config.setdefault(c, []).append(p)
+    by_configs = {}
+    for p, config_indices in configs_per_position.items():
+        by_configs.setdefault(tuple(sorted(config_indices)), []).append(p)
+    by_positions = {}
+    for c, position_indices in positions_per_config.items():
+        by_positions.setdefault(tuple(sorted(position_indices)), []).append(c)
+
+    campaigns = [(set(p), set(c)) for c, p in by_configs.items()]
+    if len(by_positions) < len(campaigns):
+        campaigns = [(set(p), set(c)) for p, c in by_positions.items()]
+
+    while len(campaigns) > max(1, max_campaigns):
+        best = None
+        for i in range(len(campaigns)):
+            for j in range(i + 1, len(campaigns)):
+                (p1, c1), (p2, c2) = campaigns[i], campaigns[j]
+                extra = len(p1 | p2) * len(c1 | c2) - len(p1) * len(c1) - len(p2) * len(c2)
+                if best is None or extra < best[0]:
+                    best = (extra, i, j)
+        _, i, j = best
+        p2, c2 = campaigns.pop(j)
+        p1, c1 = campaigns[i]
+        campaigns[i] = (p1 | p2, c1 | c2)
+
+    return [(sorted(p), sorted(c)) for p, c in campaigns]
+
+def run_adaptive_campaign(target_config, positions, glitch_configs, mode, build=False, flash=False, home=False,
+                          first_pass=1, eta=3, rounds=3, max_campaigns=16, seed=None, results_dir=os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")):
+    """
+    Successive halving over all (position, glitch config) arms of the grid.
+
+    Round 0 runs every arm with `first_pass` executions. After each round arms that
+    crashed in all of at least PRUNE_MIN_SHOTS shots are pruned, the remaining arms are
+    ranked by their smoothed success rate (weighted counts of SUCCESS_WEIGHTS[mode] over
+    all shots so far, ties go to fewer crashes, then to a random order drawn from `seed`)
+    and the best 1/eta of them run again with eta times the executions
+    of the previous round. The arms of a round run in at most `max_campaigns` CSProfiler
+    campaigns (see group_campaigns); arms outside the surviving set that end up in the
+    grid of a campaign are executed and counted as well. Every campaign is kept as
+    `results_<mode>_adaptive-round<r>-<g>.json`, the merged results of all rounds are
+    written to `results_<mode>_adaptive.json` in the usual format.
+    """
+    if rounds < 1 or eta < 2 or first_pass < 1:
+        raise ValueError(f"Invalid schedule (rounds={rounds}, eta={eta}, first_pass={first_pass}), needs rounds >= 1, eta >= 2 and first_pass >= 1")
+    if seed is None:
+        seed = random.randrange(2**32)
+    print(f"Adaptive campaign seed: {seed}")
+
+    weights = SUCCESS_WEIGHTS[mode]
+    arms = [(p, c) for p in range(len(positions)) for c in range(len(glitch_configs))]
+    totals = {arm: [0.0, 0, 0] for arm in arms} # weighted successes, shots, crashes
+    # random tie break, otherwise equal scores (most arms after a first pass of one
+    # execution) would keep the grid order and favour low position and config indices
+    order = list(range(len(arms)))
+    random.Random(seed).shuffle(order)
+    tie_break = dict(zip(arms, order))
+
+    def score(arm):
+        success, shots, _ = totals[arm]
+        return (success + 1) / (shots + 2)
+
+    def rank(arm):
+        return (score(arm), -totals[arm][2], tie_break[arm])
+
+    round_files = []
+    budget = first_pass
+    first_campaign = True
+
+    for round_index in range(rounds):
+        campaigns = group_campaigns(arms, max_campaigns)
+        executed = sum(len(p) * len(c) for p, c in campaigns)
+
+        print(f"################## ADAPTIVE ROUND {round_index}: {len(arms)} arms ({executed} executed), {budget} executions each, {len(campaigns)} campaigns ##################")
+        for group_index, (position_indices, config_indices) in enumerate(campaigns):
+            configs = []
+            for c in config_indices:
+                config = copy.copy(glitch_configs[c])
+                config.num_executions = budget
+                configs.append(config)
+
+            campaign_positions = [positions[p] for p in position_indices]
+            before = snapshot_results(results_dir)
+            profiler = create_profiler(target_config, campaign_positions, configs)
+            profiler.run_campaign(build and first_campaign, flash and first_campaign, home and first_campaign)
+            first_campaign = False
+
+            source = campaign_results_file(results_dir, before, campaign_positions, configs)
+            path = os.path.join(results_dir, f"results_{mode}_adaptive-round{round_index}-{group_index}.json")
+            shutil.copyfile(source, path)
+            round_files.append((path, position_indices, config_indices))
+
+            archive = results_table.load(path, use_cache=False)
+            for row in archive.counts:
+                arm = (position_indices[row["position_index"]], config_indices[row["config_index"]])
+                totals[arm][0] += sum(w * row[f"num_{t}"] for t, w in weights.items() if f"num_{t}" in archive.counts.dtype.names)
+                totals[arm][1] += row["shots"]
+                totals[arm][2] += row["num_crashes"]
+
+        # Prune arms that only crashed (given enough shots), keep the best 1/eta of the rest
+        survivors = [arm for arm in arms if totals[arm][1] < PRUNE_MIN_SHOTS or totals[arm][1] > totals[arm][2]]
+        survivors.sort(key=rank, reverse=True)
+        print(f"Pruned {len(arms) - len(survivors)} crash-only arms")
+        if round_index == rounds - 1 or len(survivors) <= 1:
+            arms = survivors
+            break
+        arms = survivors[:max(1, math.ceil(len(survivors) / eta))]
+        budget *= eta
+
+    print("################## ADAPTIVE RESULTS (best arms) ##################")
+    for p, c in arms[:10]:
+        success, shots, crashes = totals[(p, c)]
+        config = glitch_configs[c]
+        print(f"position {positions[p]} offset {config.pulse_offset} voltage {config.voltage} pulse_width {config.pulse_width}: "
+              f"success {success:g}/{shots} ({score((p, c)):.3f}), crashes {crashes}")
+
+    merged = merge_results(round_files, positions, glitch_configs)
+    path = os.path.join(results_dir, f"results_{mode}_adaptive.json")
+    with open(path, "w") as f:
+        json.dump(merged, f, indent=4)
+    print(f"Merged results written to {path}")
+    return merged
+
 def main():
     # ---------------------------------------------------------------------------- #
     #                             Commandline Arguments                            #
@@ -105,6 +387,13 @@ def main():
     flash = False
     home = False
     mode = "profile-attack-complete"
+    readout = "full"
+    adaptive = False
+    first_pass = 1
+    eta = 3
+    rounds = 3
+    max_campaigns = 16
+    seed = None
     if len(sys.argv) > 1:
         # Build firmware (based on target_config)
         if "--build" in sys.argv or "-b" in sys.argv:
@@ -115,6 +404,25 @@ def main():
         # Home xyz table on commandline argument
         if "--home" in sys.argv or "-h" in sys.argv:
             home = True
+        # Build the signing firmware with signature-only readout (one packet per signature)
+        if "--readout-sig" in sys.argv:
+            readout = "sig"
+        # Successive halving instead of the full grid: cheap first pass, then more
+        # executions for the best (position, glitch config) arms
+        if "--adaptive" in sys.argv:
+            adaptive = True
+        if "--first-pass" in sys.argv:
+            first_pass = int(sys.argv[sys.argv.index("--first-pass") + 1])
+        if "--eta" in sys.argv:
+            eta = int(sys.argv[sys.argv.index("--eta") + 1])
+        if "--rounds" in sys.argv:
+            rounds = int(sys.argv[sys.argv.index("--rounds") + 1])
+        # Upper bound for the CSProfiler campaigns per round (scattered survivors are merged into shared grids)
+        if "--max-campaigns" in sys.argv:
+            max_campaigns = int(sys.argv[sys.argv.index("--max-campaigns") + 1])
+        # Seed of the random tie break between equally ranked arms
+        if "--seed" in sys.argv:
+            seed = int(sys.argv[sys.argv.index("--seed") + 1])
 
         if "--profile-counter" in sys.argv:
             mode = "profile-counter"
@@ -124,13 +432,15 @@ def main():
             mode = "profile-attack-memcpy"
         if "--profile-attack-complete" in sys.argv:
             mode = "profile-attack-complete"
+    if rounds < 1 or eta < 2 or first_pass < 1 or max_campaigns < 1:
+        sys.exit("ERROR: --rounds, --first-pass and --max-campaigns have to be at least 1, --eta at least 2")
     # ---------------------------------------------------------------------------- #
     #                             Target Configuration                             #
     # ---------------------------------------------------------------------------- #
     current_dir = os.path.dirname(os.path.abspath(__file__))
     target_config = TargetConfig(
         firmware_build_dir = os.path.join(current_dir),
-        firmware_build_command = ["make", f"target-{mode}"], # [] to prevent auto building
+        firmware_build_command = ["make", f"target-{mode}", f"READOUT={readout}"], # [] to prevent auto building
         firmware_path = os.path.join(current_dir, f"pqm4/bin/crypto_sign_target-{mode}.hex")
     )
 
@@ -277,24 +587,17 @@ def main():
         #         ),
         #     ])
 
-    # ---------------------------------------------------------------------------- #
-    #                        Create and configure CSProfiler                       #
-    # ---------------------------------------------------------------------------- #
-    profiler = CSProfiler(target_config, positions, glitch_configs)
-    # Profile-counter fault signal. Contains the faulted counter value. Sent only when target detects that counter is not as expected.
-    profiler.addSimpleSerialCommand(SimpleSerialPacket("f", "Fault signal from target with buffer content (fault)", counter_fault_handler), overwrite=True)
-    # Profile-memcpy fault signal. Contains the faulted memcpy buffer (68 bytes). Sent only when target detects that buffer is not as expected.
-    profiler.addSimpleSerialCommand(SimpleSerialPacket("q", "Fault signal from target with buffer content (fault)", memcpy_fault_handler), overwrite=True)
-    # Attack data signal. Contains sm (signature and message). Sent after every signature generation
-    profiler.addSimpleSerialCommand(SimpleSerialPacket("d", "Data from target (signature and message), split up in 190 byte chunks", attack_data_handler), overwrite=True)
-
-    profiler.addResultType("faulted_sig", "Faulted Signature")
-    profiler.addResultType("detected_oil", "Detected valid OIL")
-
     # ---------------------------------------------------------------------------- #
     #                            Run CSProfiler Campaign                           #
     # ---------------------------------------------------------------------------- #
-    profiler.run_campaign(build, flash, home)
+    # CSProfiler keeps the shots of the campaign in memory and writes one JSON summary at
+    # the end; the handlers only see the data packets, so they cannot stream every shot
+    # to a result_log.ResultLog as attack_target.py does
+    if adaptive:
+        run_adaptive_campaign(target_config, positions, glitch_configs, mode, build, flash, home, first_pass, eta, rounds, max_campaigns, seed)
+    else:
+        profiler = create_profiler(target_config, positions, glitch_configs)
+        profiler.run_campaign(build, flash, home)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,150 @@
+import contextlib
+import cProfile
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+
+def _children_cpu_s():
+    # CPU time of terminated and waited-for child processes (e.g. joined worker pools)
+    times = os.times()
+    return times.children_user + times.children_system
+
+
+def _rss_peak_bytes():
+    # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class StageProfiler:
+    """
+    Collects wall time, CPU time and memory of named pipeline stages.
+
+    Stages are entered with `with profiler.stage(name, **metrics):` and may be nested;
+    the recorded name is the path of all enclosing stages joined by "/". Additional
+    metrics (e.g. system sizes) can be attached to the innermost running stage with
+    `record`. A disabled profiler records nothing, so instrumented code can always use it.
+
+    CPU time is reported as `cpu_s` for the process itself and `child_cpu_s` for the
+    child processes that finished inside the stage (worker processes count once joined).
+
+    Memory is reported as
+      - `peak_traced_bytes`: peak of Python (and NumPy) allocations inside the stage,
+        only if `trace_memory` is set (tracemalloc slows down allocations)
+      - `rss_peak_bytes`: high-water mark of the process RSS at the end of the stage,
+        which also covers native allocations (Sage, PARI, ...)
+    """
+
+    def __init__(self, enabled=True, trace_memory=False, cprofile_stages=(), cprofile_dir="."):
+        """
+        Args:
+            enabled (bool): Record stages at all
+            trace_memory (bool): Track per-stage peak memory with tracemalloc
+            cprofile_stages (iterable): Stage names (last path component) run under cProfile, "all" for every stage
+            cprofile_dir (str): Directory for the `.prof` files
+        """
+        self.enabled = enabled
+        self.trace_memory = trace_memory
+        self.cprofile_stages = set(cprofile_stages)
+        self.cprofile_dir = cprofile_dir
+        self.stages = []
+        # free-form run information (versions, inputs) included in the report
+        self.info = {}
+        self._stack = []
+        self._cprofile_active = False
+        self._start = time.time()
+
+        if self.enabled and self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def _wants_cprofile(self, name):
+        return not self._cprofile_active and ("all" in self.cprofile_stages or name in self.cprofile_stages)
+
+    @contextlib.contextmanager
+    def stage(self, name, **metrics):
+        """
+        Profile the enclosed block as stage `name` with optional initial metrics.
+        """
+        if not self.enabled:
+            yield
+            return
+
+        record = {
+            "name": "/".join([s["name"] for s in self._stack] + [name]),
+            "metrics": dict(metrics),
+        }
+        frame = {"name": name, "record": record, "peak": 0}
+
+        if self.trace_memory:
+            # the peak so far belongs to the enclosing stage
+            if self._stack:
+                self._stack[-1]["peak"] = max(self._stack[-1]["peak"], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        profile = None
+        if self._wants_cprofile(name):
+            profile = cProfile.Profile()
+            self._cprofile_active = True
+
+        self._stack.append(frame)
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        child_cpu = _children_cpu_s()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+                self._cprofile_active = False
+            record["wall_s"] = time.perf_counter() - wall
+            record["cpu_s"] = time.process_time() - cpu
+            record["child_cpu_s"] = _children_cpu_s() - child_cpu
+            self._stack.pop()
+
+            if self.trace_memory:
+                record["peak_traced_bytes"] = max(frame["peak"], tracemalloc.get_traced_memory()[1])
+                if self._stack:
+                    self._stack[-1]["peak"] = max(self._stack[-1]["peak"], record["peak_traced_bytes"])
+            record["rss_peak_bytes"] = _rss_peak_bytes()
+
+            if profile is not None:
+                os.makedirs(self.cprofile_dir, exist_ok=True)
+                path = os.path.join(self.cprofile_dir, f"{record['name'].replace('/', '.')}-{len(self.stages)}.prof")
+                profile.dump_stats(path)
+                record["cprofile"] = path
+
+            self.stages.append(record)
+
+    def record(self, **metrics):
+        """
+        Attach metrics to the innermost running stage.
+        """
+        if self.enabled and self._stack:
+            self._stack[-1]["record"]["metrics"].update(metrics)
+
+    def report(self):
+        """
+        Returns:
+            dict: Report with all finished stages in order of completion
+        """
+        return {
+            "started": self._start,
+            "python": sys.version.split()[0],
+            "trace_memory": self.trace_memory,
+            "info": self.info,
+            "stages": self.stages,
+        }
+
+    def write(self, path):
+        """
+        Write the report as JSON file.
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=4)
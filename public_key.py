@@ -0,0 +1,246 @@
+import functools
+import hashlib
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+
+# ASCII -> nibble value for hex digits, 0xFF for everything else
+_HEX_VALUES = np.full(256, 0xFF, dtype=np.uint8)
+for _i, _c in enumerate(b"0123456789abcdef"):
+    _HEX_VALUES[_c] = _i
+for _i, _c in enumerate(b"ABCDEF"):
+    _HEX_VALUES[_c] = 10 + _i
+
+
+def pk_size(v, m):
+    """
+    Size in bytes of an expanded (classic) UOV public key.
+    """
+    n = v + m
+    return m * n * (n + 1) // 2
+
+
+@functools.lru_cache(maxsize=None)
+def pk_index_map(v, m):
+    """
+    Map every m-byte entry of the expanded public key to its (row, column)
+    position in the upper-triangular n x n matrices.
+
+    pqov stores the public key as P1 (upper-triangular v x v), P2 (v x m, row-major)
+    and P3 (upper-triangular m x m), one byte per equation for every entry.
+
+    Returns:
+        tuple: (rows, cols) index arrays of length n*(n+1)/2
+    """
+    p1_rows, p1_cols = np.triu_indices(v)
+    p2_rows = np.repeat(np.arange(v), m)
+    p2_cols = np.tile(np.arange(m), v) + v
+    p3_rows, p3_cols = np.triu_indices(m)
+
+    rows = np.concatenate([p1_rows, p2_rows, p3_rows + v])
+    cols = np.concatenate([p1_cols, p2_cols, p3_cols + v])
+    rows.flags.writeable = False
+    cols.flags.writeable = False
+    return rows, cols
+
+
+def parse_hex_array(text):
+    """
+    Parse the bytes of a C array initializer (e.g. `keys/pk.h`).
+
+    Accepts `0xAB, 0xCD, ...` (optionally wrapped in a C declaration) as well as
+    plain comma separated hex values.
+
+    Args:
+        text (str | bytes): File contents
+
+    Returns:
+        np.ndarray: uint8 array of the parsed bytes
+    """
+    if isinstance(text, str):
+        text = text.encode()
+    if b"{" in text:
+        text = text[text.index(b"{") + 1:text.rindex(b"}")]
+
+    chars = np.frombuffer(text, dtype=np.uint8)
+    prefix = np.flatnonzero((chars[:-2] == ord("x")) | (chars[:-2] == ord("X")))
+    if len(prefix) == 0:
+        # plain hex values without 0x prefix
+        return np.frombuffer(bytes.fromhex(text.replace(b",", b" ").decode()), dtype=np.uint8).copy()
+
+    high = _HEX_VALUES[chars[prefix + 1]]
+    low = _HEX_VALUES[chars[prefix + 2]]
+    if (high == 0xFF).any() or (low == 0xFF).any():
+        raise ValueError("Invalid hex value in key file")
+    return (high << 4) | low
+
+
+def pk_to_tensor(pk, v=68, m=44):
+    """
+    Scatter an expanded public key into its upper-triangular matrices.
+
+    Args:
+        pk (np.ndarray | bytes): Expanded public key (pk_size(v, m) bytes)
+        v (int): Number of vinegar variables
+        m (int): Number of oil variables / equations
+
+    Returns:
+        np.ndarray: (m, n, n) uint8 tensor, P[k] is the k-th public matrix
+    """
+    pk = np.frombuffer(pk, dtype=np.uint8) if isinstance(pk, (bytes, bytearray)) else np.asarray(pk, dtype=np.uint8)
+    if len(pk) != pk_size(v, m):
+        raise ValueError(f"Invalid public key length {len(pk)} (expected {pk_size(v, m)} for v={v}, m={m})")
+
+    n = v + m
+    rows, cols = pk_index_map(v, m)
+    P = np.zeros((m, n, n), dtype=np.uint8)
+    P[:, rows, cols] = pk.reshape(-1, m).T
+    return P
+
+
+def load_pk(path, v=68, m=44):
+    """
+    Load a public key header file (e.g. `keys/pk.h`) as (m, n, n) uint8 tensor.
+    """
+    with open(path, "rb") as file:
+        return pk_to_tensor(parse_hex_array(file.read()), v, m)
+
+
+def tensor_to_pk(P, v=68, m=44):
+    """
+    Inverse of pk_to_tensor: gather the expanded public key bytes from the
+    upper-triangular (m, n, n) tensor.
+    """
+    rows, cols = pk_index_map(v, m)
+    return np.ascontiguousarray(np.asarray(P, dtype=np.uint8)[:, rows, cols].T).reshape(-1)
+
+
+def write_pk(path, P, v=68, m=44):
+    """
+    Write a public key tensor as C header in the format of `keys/pk.h`.
+    """
+    pk = tensor_to_pk(P, v, m)
+    values = ", ".join(f"0x{b:02X}" for b in pk.tolist())
+    with open(path, "w") as file:
+        file.write(f"#ifndef PK_H\n#define PK_H\n\nconst unsigned char pk_comp[{len(pk)}] = {{{values}}};\n\n#endif // PK_H\n")
+
+
+def upper_to_symmetric(P):
+    """
+    Turn upper-triangular matrices into the symmetric matrices P + P^T
+    (the diagonal vanishes in characteristic 2).
+    """
+    return P ^ np.swapaxes(P, -1, -2)
+
+
+def key_hash(pk, v=68, m=44):
+    """
+    Hash identifying a public key (expanded key bytes and parameters).
+
+    This is the identity of a key everywhere (cache entries, checkpoints).
+    """
+    h = hashlib.sha256(f"uov-v{v}-m{m}:".encode())
+    h.update(np.ascontiguousarray(pk, dtype=np.uint8).tobytes())
+    return h.hexdigest()
+
+
+def tensor_hash(P):
+    """
+    key_hash of a public key given as upper-triangular (m, n, n) tensor.
+    """
+    m, n = P.shape[0], P.shape[1]
+    return key_hash(tensor_to_pk(P, n - m, m), n - m, m)
+
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "build", "pk_cache")
+
+
+class PublicKeyCache:
+    """
+    On-disk cache of derived public key structures.
+
+    Every public key gets one entry directory named after the hash of its key bytes,
+    containing the upper-triangular and symmetric (m, n, n) tensors as `.npy` files
+    that are memory-mapped on load. The modification time of an entry is refreshed on
+    every hit and used for LRU eviction once the cache grows beyond `max_bytes`.
+    """
+
+    FILES = ("upper.npy", "symmetric.npy")
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=512 * 2**20):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def load(self, path, v=68, m=44):
+        """
+        Load a public key header file, using the cached tensors if available.
+
+        Args:
+            path (str): Path to public key file (e.g. `keys/pk.h`)
+            v (int): Number of vinegar variables
+            m (int): Number of oil variables / equations
+
+        Returns:
+            tuple: (upper, symmetric) read-only (m, n, n) uint8 tensors
+        """
+        with open(path, "rb") as file:
+            pk = parse_hex_array(file.read())
+        entry = os.path.join(self.cache_dir, key_hash(pk, v, m))
+
+        try:
+            tensors = tuple(np.load(os.path.join(entry, f), mmap_mode="r") for f in self.FILES)
+        except (OSError, ValueError):
+            # Cache miss (or corrupted entry): derive and store
+            upper = pk_to_tensor(pk, v, m)
+            tensors = (upper, upper_to_symmetric(upper))
+            self._store(entry, tensors)
+        else:
+            os.utime(entry)
+
+        return tensors
+
+    def invalidate(self, pk_hash=None):
+        """
+        Remove the entry for one key hash, or the whole cache if no hash is given.
+        """
+        if pk_hash is None:
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+        else:
+            shutil.rmtree(os.path.join(self.cache_dir, pk_hash), ignore_errors=True)
+
+    def _store(self, entry, tensors):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Write to a temporary directory first so that concurrent runs never see partial entries
+        tmp = tempfile.mkdtemp(dir=self.cache_dir, prefix=".tmp-")
+        try:
+            for f, tensor in zip(self.FILES, tensors):
+                np.save(os.path.join(tmp, f), tensor)
+            shutil.rmtree(entry, ignore_errors=True)
+            os.replace(tmp, entry)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        self._evict(keep=entry)
+
+    def _evict(self, keep=None):
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            entry = os.path.join(self.cache_dir, name)
+            if name.startswith(".") or not os.path.isdir(entry):
+                continue
+            size = sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+            entries.append((os.path.getmtime(entry), size, entry))
+            total += size
+
+        # Least recently used first
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if entry == keep:
+                continue
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
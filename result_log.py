@@ -0,0 +1,368 @@
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+
+# Result types every CSProfiler campaign reports (in the order of the JSON summary),
+# campaign specific types (e.g. faulted_sig, detected_oil) follow
+DEFAULT_RESULT_TYPES = ["nofaults", "faults", "crashes", "resets", "soft_bricked", "hard_bricked", "skipped"]
+
+SUMMARY_INFO = "num_nofaults specifies the number of faults for every position from the positions array (equivalent for num_nofaults, num_resets, num_crashes)"
+
+
+def index_path(log_path):
+    return log_path + ".idx"
+
+
+def _key(position_index, config_index):
+    return f"{position_index},{config_index}"
+
+
+class ResultLog:
+    """
+    Append-only, line-delimited JSON log of a campaign.
+
+    Every shot is one line, so a crash loses at most the records written since the
+    last fsync and memory use does not grow with the campaign. Lines are
+      - {"type": "campaign", "positions": [...], "result_types": [...], "info": {...}}
+      - {"type": "glitch_config", "index": j, "config": {...}}
+      - {"type": "shot", "position_index": i, "config_index": j, "result": "...", "data": {...} | null}
+      - {"type": "error", "message": "..."}
+
+    The file is fsynced every `fsync_every` records or `fsync_interval` seconds. The
+    index next to the log (`<log>.idx`) maps "position_index,config_index" to the byte
+    ranges [start, end, count] of its shot records; shots of one configuration are
+    usually consecutive, so it stays a few entries per configuration. It is written on
+    every sync and rebuilt from the log if it is missing or stale.
+    """
+
+    def __init__(self, path, fsync_every=64, fsync_interval=1.0):
+        """
+        Args:
+            path (str): Log file, appended to if it exists
+            fsync_every (int): Records between two fsyncs
+            fsync_interval (float): Maximum seconds between two fsyncs
+        """
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        _truncate_partial_record(path)
+        self.index = load_index(path)
+        self.file = open(path, "ab")
+        self.offset = self.file.tell()
+        self.pending = 0
+        self.last_sync = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def append(self, record):
+        """
+        Append one record (dict) and sync if the batch is full.
+        """
+        line = (json.dumps(record, separators=(",", ":")) + "\n").encode()
+        with self.lock:
+            start = self.offset
+            self.file.write(line)
+            self.offset += len(line)
+            if record.get("type") == "shot":
+                _index_add(self.index, _key(record["position_index"], record["config_index"]), start, self.offset)
+            self.pending += 1
+            if self.pending >= self.fsync_every or time.monotonic() - self.last_sync >= self.fsync_interval:
+                self._sync()
+
+    def campaign(self, positions, result_types=(), **info):
+        self.append({"type": "campaign", "positions": positions, "result_types": list(result_types), "info": info})
+
+    def glitch_config(self, index, config):
+        self.append({"type": "glitch_config", "index": index, "config": config})
+
+    def shot(self, position_index, config_index, result, data=None, **extra):
+        self.append({"type": "shot", "position_index": position_index, "config_index": config_index, "result": result, "data": data, **extra})
+
+    def error(self, message):
+        self.append({"type": "error", "message": message})
+
+    def sync(self):
+        with self.lock:
+            if not self.file.closed:
+                self._sync()
+
+    def _sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        _write_index(self.path, self.index, self.offset)
+        self.pending = 0
+        self.last_sync = time.monotonic()
+
+    def close(self):
+        with self.lock:
+            if self.file.closed:
+                return
+            self._sync()
+            self.file.close()
+
+
+def _index_add(index, key, start, end):
+    ranges = index.setdefault(key, [])
+    if ranges and ranges[-1][1] == start:
+        ranges[-1][1] = end
+        ranges[-1][2] += 1
+    else:
+        ranges.append([start, end, 1])
+
+
+def _truncate_partial_record(path):
+    # a crash while writing leaves an incomplete last line, drop it before appending
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return
+    with open(path, "rb+") as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        position = size
+        while position > 0:
+            step = min(4096, position)
+            f.seek(position - step)
+            chunk = f.read(step)
+            newline = chunk.rfind(b"\n")
+            if newline >= 0:
+                position = position - step + newline + 1
+                break
+            position -= step
+        if position != size:
+            f.truncate(position)
+
+
+def _write_index(path, index, size):
+    tmp = index_path(path) + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"size": size, "index": index}, f, separators=(",", ":"))
+    os.replace(tmp, index_path(path))
+
+
+def load_index(path):
+    """
+    Index of a log ({"position_index,config_index": [[start, end, count], ...]}),
+    rebuilt by scanning the log if the index file does not match the log size.
+    """
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(index_path(path), "r") as f:
+            stored = json.load(f)
+        if stored["size"] == os.path.getsize(path):
+            return stored["index"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    index = {}
+    for start, end, record in _scan(path):
+        if record.get("type") == "shot":
+            _index_add(index, _key(record["position_index"], record["config_index"]), start, end)
+    return index
+
+
+def _scan(path):
+    with open(path, "rb") as f:
+        start = 0
+        for line in f:
+            end = start + len(line)
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # incomplete last record of an interrupted campaign
+                break
+            yield start, end, record
+            start = end
+
+
+def read_records(path):
+    """
+    Iterate over all records of a log.
+    """
+    for _, _, record in _scan(path):
+        yield record
+
+
+def read_shots(path, position_index, config_index, index=None):
+    """
+    Iterate over the shot records of one (position, glitch config) using the index.
+    """
+    if index is None:
+        index = load_index(path)
+    with open(path, "rb") as f:
+        for start, end, _ in index.get(_key(position_index, config_index), []):
+            f.seek(start)
+            for line in f.read(end - start).splitlines():
+                yield json.loads(line)
+
+
+def rebuild_summary(path):
+    """
+    Rebuild the JSON summary of CSProfiler (as in `results/*.json`) from a log.
+
+    Returns:
+        dict: Summary with positions, glitch configs and per position counters / data
+    """
+    positions = []
+    result_types = list(DEFAULT_RESULT_TYPES)
+    configs = {}
+    errors = []
+
+    def config_results(index):
+        if index not in configs:
+            configs[index] = {"config": {}, "counts": {}, "data": {}}
+        return configs[index]
+
+    for record in read_records(path):
+        kind = record.get("type")
+        if kind == "campaign":
+            positions = record["positions"]
+            result_types.extend(t for t in record.get("result_types", []) if t not in result_types)
+        elif kind == "glitch_config":
+            config_results(record["index"])["config"] = record["config"]
+        elif kind == "shot":
+            result = record["result"]
+            if result not in result_types:
+                result_types.append(result)
+            results = config_results(record["config_index"])
+            position_index = record["position_index"]
+            counts = results["counts"].setdefault(result, {})
+            counts[position_index] = counts.get(position_index, 0) + 1
+            if record.get("data") is not None:
+                entries = results["data"].setdefault(result, {})
+                entries.setdefault(position_index, []).append(record["data"])
+        elif kind == "error":
+            errors.append(record["message"])
+
+    glitch_configs = []
+    for index in sorted(configs):
+        results = configs[index]
+        summary_results = {}
+        for result_type in result_types:
+            counts = results["counts"].get(result_type, {})
+            summary_results[f"num_{result_type}"] = [counts.get(p, 0) for p in range(len(positions))]
+        for result_type, entries in results["data"].items():
+            summary_results[result_type] = [{"position_index": p, "data": data} for p, data in entries.items()]
+        glitch_configs.append({**results["config"], "results": summary_results})
+
+    return {
+        "Info: glitch_config results structure": SUMMARY_INFO,
+        "catched_errors": errors,
+        "positions": positions,
+        "glitch_configs": glitch_configs,
+    }
+
+
+def load_summary(path):
+    """
+    Read a JSON summary (`results/*.json`). Hand-edited archives with trailing commas
+    (e.g. transfer-step2.json) are repaired with a warning.
+    """
+    with open(path, "r") as f:
+        text = f.read()
+    try:
+        return json.loads(text)
+    except ValueError as e:
+        repaired = re.sub(r",(\s*[}\]])", r"\1", text)
+        try:
+            summary = json.loads(repaired)
+        except ValueError:
+            raise ValueError(f"{path}: invalid JSON ({e})") from None
+        print(f"WARNING: {path}: invalid JSON ({e}), loaded after removing trailing commas", file=sys.stderr)
+        return summary
+
+
+def import_summary(summary, log):
+    """
+    Write the records of an existing JSON summary to a ResultLog.
+
+    The summary does not keep the order of the shots, the shots of every
+    (position, glitch config) are written grouped by result type.
+    """
+    result_types = []
+    for glitch_config in summary["glitch_configs"]:
+        for key in glitch_config["results"]:
+            result_type = key[len("num_"):] if key.startswith("num_") else key
+            if result_type not in DEFAULT_RESULT_TYPES and result_type not in result_types:
+                result_types.append(result_type)
+
+    log.campaign(summary["positions"], result_types)
+    for message in summary.get("catched_errors", []):
+        log.error(message)
+
+    for config_index, glitch_config in enumerate(summary["glitch_configs"]):
+        results = glitch_config["results"]
+        log.glitch_config(config_index, {k: v for k, v in glitch_config.items() if k != "results"})
+        for position_index in range(len(summary["positions"])):
+            for key, counts in results.items():
+                if not key.startswith("num_"):
+                    continue
+                result_type = key[len("num_"):]
+                data = []
+                for entry in results.get(result_type, []):
+                    if entry["position_index"] == position_index:
+                        data.extend(entry["data"])
+                for i in range(max(counts[position_index], len(data))):
+                    log.shot(position_index, config_index, result_type, data[i] if i < len(data) else None)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Append-only campaign result logs')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    summary_parser = subparsers.add_parser('summary', help='Rebuild the JSON summary from a log')
+    summary_parser.add_argument('log', help='Result log (jsonl)')
+    summary_parser.add_argument('-o', '--output', default=None, help='Output file (default: log with .json suffix, "-" for stdout)')
+
+    import_parser = subparsers.add_parser('import', help='Convert a JSON summary into a log')
+    import_parser.add_argument('summary', help='JSON summary (results/*.json)')
+    import_parser.add_argument('log', help='Result log to create')
+
+    show_parser = subparsers.add_parser('show', help='Show the index or the shots of one (position, glitch config)')
+    show_parser.add_argument('log', help='Result log (jsonl)')
+    show_parser.add_argument('--position', type=int, default=None, help='Position index')
+    show_parser.add_argument('--config', type=int, default=None, help='Glitch config index')
+    args = parser.parse_args()
+
+    if args.command == 'summary':
+        summary = rebuild_summary(args.log)
+        output = args.output or os.path.splitext(args.log)[0] + ".json"
+        if output == "-":
+            json.dump(summary, sys.stdout, indent=4)
+        else:
+            with open(output, "w") as f:
+                json.dump(summary, f, indent=4)
+            print(f"Summary written to {output}")
+
+    elif args.command == 'import':
+        summary = load_summary(args.summary)
+        if os.path.exists(args.log):
+            sys.exit(f"{args.log} exists")
+        with ResultLog(args.log, fsync_every=10000, fsync_interval=60) as log:
+            import_summary(summary, log)
+        print(f"Log written to {args.log}")
+
+    elif args.command == 'show':
+        index = load_index(args.log)
+        if args.position is None or args.config is None:
+            for key, ranges in index.items():
+                if args.position is not None and not key.startswith(f"{args.position},"):
+                    continue
+                if args.config is not None and not key.endswith(f",{args.config}"):
+                    continue
+                print(f"position,config {key}: {sum(r[2] for r in ranges)} shots in {len(ranges)} ranges")
+        else:
+            for record in read_shots(args.log, args.position, args.config, index):
+                print(json.dumps(record))
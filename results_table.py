@@ -0,0 +1,322 @@
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+import numpy as np
+
+import result_log
+
+
+# Bump when the layout of the cached arrays changes
+CACHE_VERSION = 1
+
+# Glitch config fields copied into every row of the counts table
+CONFIG_FIELDS = [
+    ("probe", "U32"),
+    ("voltage", np.int64),
+    ("pulse_width", np.int64),
+    ("pulse_spacing", np.int64),
+    ("pulse_repeats", np.int64),
+    ("pulse_offset", np.int64),
+    ("num_executions", np.int64),
+    ("dead_timeout", np.int64),
+]
+
+
+def cache_path(path):
+    return path + ".cache.npz"
+
+
+def _payload_bytes(value):
+    if isinstance(value, str):
+        try:
+            return bytes.fromhex(value)
+        except ValueError:
+            pass
+    return str(value).encode()
+
+
+class Archive:
+    """
+    Columnar view of a results archive (`results/*.json` of profile_target.py or a
+    result log of attack_target.py).
+
+    Attributes:
+        positions (np.ndarray): (P, 3) float positions
+        counts (np.ndarray): Structured array, one row per (glitch config, position) with
+            config_index, position_index, x, y, z, the glitch config fields (see CONFIG_FIELDS),
+            one `num_<result type>` column per result type and `shots` (sum of all of them)
+        events (np.ndarray): Structured array, one row per stored result entry with
+            config_index, position_index, pulse_offset, result and per payload key either an
+            integer column (e.g. `counter`) or `<key>_offset` / `<key>_len` into `payload`
+        payload (np.ndarray): uint8 blob with the hex payloads (msg, sig, oil, ...) as bytes
+        result_types (list): Result types in column order
+    """
+
+    def __init__(self, positions, counts, events, payload, result_types, source=None):
+        self.positions = positions
+        self.counts = counts
+        self.events = events
+        self.payload = payload
+        self.result_types = result_types
+        self.source = source
+
+    def event_payload(self, event, key):
+        """
+        Payload bytes of one event row (None if the event has no such value).
+        """
+        offset = event[f"{key}_offset"]
+        if offset < 0:
+            return None
+        return self.payload[offset:offset + event[f"{key}_len"]].tobytes()
+
+    def save(self, path, source_stat):
+        meta = {
+            "version": CACHE_VERSION,
+            "source_size": source_stat.st_size,
+            "source_mtime_ns": source_stat.st_mtime_ns,
+            "result_types": self.result_types,
+        }
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, meta=np.array(json.dumps(meta)), positions=self.positions,
+                 counts=self.counts, events=self.events, payload=self.payload)
+        os.replace(tmp, path)
+
+    @classmethod
+    def from_cache(cls, path, source_stat):
+        """
+        Load the cached arrays, None if there is no valid cache for the source file.
+        """
+        try:
+            with np.load(path, allow_pickle=False) as cached:
+                meta = json.loads(str(cached["meta"]))
+                if (meta["version"] != CACHE_VERSION or meta["source_size"] != source_stat.st_size
+                        or meta["source_mtime_ns"] != source_stat.st_mtime_ns):
+                    return None
+                return cls(cached["positions"], cached["counts"], cached["events"], cached["payload"], meta["result_types"])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    @classmethod
+    def from_summary(cls, summary):
+        """
+        Flatten a parsed JSON summary.
+        """
+        positions = np.array(summary["positions"], dtype=np.float64).reshape(-1, 3)
+        glitch_configs = summary["glitch_configs"]
+
+        result_types = []
+        payload_keys = {}
+        for glitch_config in glitch_configs:
+            for key, value in glitch_config["results"].items():
+                if key.startswith("num_"):
+                    if key[4:] not in result_types:
+                        result_types.append(key[4:])
+                    continue
+                for entry in value:
+                    for data in entry["data"]:
+                        for field, field_value in (data or {}).items():
+                            kind = "int" if isinstance(field_value, int) else "bytes"
+                            if payload_keys.get(field, kind) != kind:
+                                kind = "bytes"
+                            payload_keys[field] = kind
+
+        # counts table: one row per (glitch config, position)
+        num_positions = len(positions)
+        dtype = [("config_index", np.int32), ("position_index", np.int32), ("x", np.float64), ("y", np.float64), ("z", np.float64)]
+        dtype += CONFIG_FIELDS
+        dtype += [(f"num_{t}", np.int64) for t in result_types] + [("shots", np.int64)]
+        counts = np.zeros(len(glitch_configs) * num_positions, dtype=dtype)
+        counts["config_index"] = np.repeat(np.arange(len(glitch_configs)), num_positions)
+        counts["position_index"] = np.tile(np.arange(num_positions), len(glitch_configs))
+        for axis, column in enumerate("xyz"):
+            counts[column] = np.tile(positions[:, axis], len(glitch_configs))
+        for field, _ in CONFIG_FIELDS:
+            values = [glitch_config.get(field, "" if field == "probe" else -1) for glitch_config in glitch_configs]
+            counts[field] = np.repeat(np.array(values), num_positions)
+        for t in result_types:
+            column = np.array([glitch_config["results"].get(f"num_{t}", [0] * num_positions) for glitch_config in glitch_configs], dtype=np.int64)
+            counts[f"num_{t}"] = column.reshape(-1)
+            counts["shots"] += counts[f"num_{t}"]
+
+        # events table: one row per stored data entry, hex payloads go into one blob
+        event_dtype = [("config_index", np.int32), ("position_index", np.int32), ("pulse_offset", np.int64), ("result", "U32")]
+        for field, kind in payload_keys.items():
+            if kind == "int":
+                event_dtype.append((field, np.int64))
+            else:
+                event_dtype += [(f"{field}_offset", np.int64), (f"{field}_len", np.int32)]
+        rows = []
+        blob = bytearray()
+        for config_index, glitch_config in enumerate(glitch_configs):
+            for result_type, value in glitch_config["results"].items():
+                if result_type.startswith("num_"):
+                    continue
+                for entry in value:
+                    for data in entry["data"]:
+                        row = [config_index, entry["position_index"], glitch_config.get("pulse_offset", -1), result_type]
+                        for field, kind in payload_keys.items():
+                            field_value = (data or {}).get(field)
+                            if kind == "int":
+                                row.append(-1 if field_value is None else field_value)
+                            elif field_value is None:
+                                row += [-1, 0]
+                            else:
+                                raw = _payload_bytes(field_value)
+                                row += [len(blob), len(raw)]
+                                blob += raw
+                        rows.append(tuple(row))
+        events = np.array(rows, dtype=event_dtype)
+        payload = np.frombuffer(bytes(blob), dtype=np.uint8)
+
+        return cls(positions, counts, events, payload, result_types)
+
+
+def load(path, use_cache=True):
+    """
+    Load a results archive as Archive, using the cache next to the source file
+    (`<source>.cache.npz`) if it is up to date.
+
+    Args:
+        path (str): JSON summary or result log (`.jsonl`)
+        use_cache (bool): Read and write the cache
+
+    Returns:
+        Archive: Columnar archive
+    """
+    stat = os.stat(path)
+    if use_cache:
+        archive = Archive.from_cache(cache_path(path), stat)
+        if archive is not None:
+            archive.source = path
+            return archive
+
+    if path.endswith(".jsonl"):
+        summary = result_log.rebuild_summary(path)
+    else:
+        summary = result_log.load_summary(path)
+    archive = Archive.from_summary(summary)
+    archive.source = path
+    if use_cache:
+        try:
+            archive.save(cache_path(path), stat)
+        except OSError as e:
+            print(f"WARNING: cannot write cache for {path} ({e})", file=sys.stderr)
+    return archive
+
+
+def where(table, **conditions):
+    """
+    Filter rows of a structured array.
+
+    Conditions are `column=value`, `column=[values]` (any of) or `column=(low, high)`
+    (inclusive range), e.g. `where(archive.counts, voltage=300, pulse_offset=(358984400, 358984500))`.
+    """
+    mask = np.ones(len(table), dtype=bool)
+    for column, condition in conditions.items():
+        if isinstance(condition, tuple):
+            low, high = condition
+            mask &= (table[column] >= low) & (table[column] <= high)
+        elif isinstance(condition, (list, set, np.ndarray)):
+            mask &= np.isin(table[column], list(condition))
+        else:
+            mask &= table[column] == condition
+    return table[mask]
+
+
+def group_by(table, keys, columns=None):
+    """
+    Sum columns of a structured array per unique combination of key columns.
+
+    Args:
+        table (np.ndarray): Structured array (e.g. Archive.counts)
+        keys (list): Key column names
+        columns (list): Columns to sum (default: all `num_*` columns and `shots`)
+
+    Returns:
+        np.ndarray: Structured array with the key columns, the summed columns and `rows`
+    """
+    if columns is None:
+        columns = [c for c in table.dtype.names if c.startswith("num_") or c == "shots"]
+    # combine the per-column codes into one integer key (faster than np.unique on records)
+    values, codes = zip(*(np.unique(table[k], return_inverse=True) for k in keys))
+    combined = np.ravel_multi_index([c.reshape(-1) for c in codes], [len(v) for v in values]) if len(table) else np.zeros(0, dtype=np.int64)
+    unique, inverse = np.unique(combined, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    first = np.unravel_index(unique, [len(v) for v in values])
+
+    dtype = [(k, table.dtype[k]) for k in keys] + [(c, np.int64) for c in columns] + [("rows", np.int64)]
+    grouped = np.zeros(len(unique), dtype=dtype)
+    for k, v, index in zip(keys, values, first):
+        grouped[k] = v[index]
+    for c in columns:
+        grouped[c] = np.bincount(inverse, weights=table[c], minlength=len(unique)).astype(np.int64)
+    grouped["rows"] = np.bincount(inverse, minlength=len(unique))
+    return grouped
+
+
+def success_counts(grouped, outcomes):
+    """
+    Number of shots with one of the outcome result types, e.g. `["detected_oil"]`.
+    """
+    success = np.zeros(len(grouped), dtype=np.int64)
+    for t in outcomes:
+        if f"num_{t}" in grouped.dtype.names:
+            success += grouped[f"num_{t}"]
+    return success
+
+
+def success_rate(grouped, outcomes):
+    """
+    Fraction of shots with one of the outcome result types (NaN for groups without shots).
+    """
+    shots = grouped["shots"]
+    return np.where(shots > 0, success_counts(grouped, outcomes) / np.maximum(shots, 1), np.nan)
+
+
+def parse_condition(text):
+    column, value = text.split("=", 1)
+    if ":" in value:
+        low, high = value.split(":", 1)
+        return column, (float(low), float(high))
+    values = [float(v) if re.fullmatch(r"-?[0-9.]+", v) else v for v in value.split(",")]
+    return column, values[0] if len(values) == 1 else values
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Query results archives (results/*.json or result logs) as columns')
+    parser.add_argument('results', nargs='+', help='Results files')
+    parser.add_argument('--group-by', nargs='+', default=["position_index", "pulse_offset"], help='Key columns')
+    parser.add_argument('--success', nargs='+', default=["detected_oil"], help='Result types counted as success')
+    parser.add_argument('--where', nargs='+', default=[], metavar='COLUMN=VALUE', help='Filters: column=value, column=a,b,c or column=low:high')
+    parser.add_argument('--min-rate', type=float, default=None, help='Only print groups with at least this success rate')
+    parser.add_argument('--no-cache', action='store_true', help='Neither read nor write the cache next to the results files')
+    args = parser.parse_args()
+
+    conditions = dict(parse_condition(c) for c in args.where)
+    for path in args.results:
+        start = time.perf_counter()
+        try:
+            archive = load(path, use_cache=not args.no_cache)
+        except (OSError, ValueError) as e:
+            print(f"{path}: cannot read ({e})", file=sys.stderr)
+            continue
+        missing = [k for k in args.group_by if k not in archive.counts.dtype.names]
+        if missing:
+            print(f"{path}: unknown columns {missing}", file=sys.stderr)
+            continue
+
+        grouped = group_by(where(archive.counts, **conditions), args.group_by)
+        success = success_counts(grouped, args.success)
+        rate = success_rate(grouped, args.success)
+        elapsed = time.perf_counter() - start
+
+        print(f"################## {path} ({len(archive.counts)} rows, {len(archive.events)} events, {elapsed * 1000:.1f} ms) ##################")
+        print(" ".join(f"{k:>14}" for k in args.group_by) + f" {'shots':>7} {'success':>7} {'rate':>7}")
+        for i, row in enumerate(grouped):
+            if args.min_rate is not None and not rate[i] >= args.min_rate:
+                continue
+            print(" ".join(f"{row[k]:>14}" for k in args.group_by) + f" {row['shots']:>7} {success[i]:>7} {rate[i]:>7.3f}")
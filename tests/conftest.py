@@ -0,0 +1,6 @@
+import os
+import sys
+
+# the modules under test are top-level scripts of the repository
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
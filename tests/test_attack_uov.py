@@ -0,0 +1,94 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+import attack_UOV
+import gf256
+import profiling
+import public_key
+from conftest import REPO
+
+
+PK_PATH = os.path.join(REPO, "keys", "pk.h")
+ATTACK_LOG = os.path.join(REPO, "results", "whitebox-attack.log")
+
+
+@pytest.fixture(scope="module")
+def archive():
+    """
+    Public key and the valid, independent oil candidates of the bundled white-box attack log.
+    """
+    (attack_UOV.v, attack_UOV.m, attack_UOV.n, attack_UOV.q, attack_UOV.fixed,
+     attack_UOV.K, attack_UOV.F, attack_UOV.R, attack_UOV.x) = attack_UOV.init_globals(field=False)
+    PK_tensor = attack_UOV.readPK(PK_PATH)
+    PKSymm_tensor = public_key.upper_to_symmetric(PK_tensor)
+    valid = attack_UOV.ScreenCandidates(attack_UOV.ReadCandidates(ATTACK_LOG), PK_tensor)
+    span = attack_UOV.AssembleSpan(valid)
+    assert len(span) == attack_UOV.m
+    return PK_tensor, PKSymm_tensor, span
+
+
+def test_linear_reconciliation_recovers_archived_oil_space(archive, monkeypatch):
+    PK_tensor, PKSymm_tensor, span = archive
+    m = attack_UOV.m
+    profiler = profiling.StageProfiler()
+    monkeypatch.setattr(attack_UOV, "profiler", profiler)
+    monkeypatch.setattr(attack_UOV, "w", 2, raising=False)
+
+    # two known vectors determine every further one linearly, so neither Kipnis-Shamir
+    # nor the Groebner engine (the Sage matrices) is needed
+    Oilspace = attack_UOV.RecoverOilspace(span[:2], None, None, PK_tensor, PKSymm_tensor, None, None)
+
+    assert Oilspace is not None and len(Oilspace) == m
+    paths = [s["metrics"]["path"] for s in profiler.stages if s["name"] == "SolveSystem"]
+    assert paths == ["linear"] * (m - 2)
+    assert gf256.is_oil_batch(PK_tensor, np.array(Oilspace)).all()
+
+    # same subspace as the one spanned by the archived candidates
+    basis = gf256.EchelonBasis(attack_UOV.n)
+    basis.extend(np.array(span))
+    assert not any(basis.add(oil) for oil in Oilspace)
+
+
+def test_recovered_oil_space_passes_check_oil(archive, monkeypatch):
+    pytest.importorskip("sage.all")
+    PK_tensor, PKSymm_tensor, span = archive
+    monkeypatch.setattr(attack_UOV, "w", 2, raising=False)
+    attack_UOV.K, attack_UOV.F, attack_UOV.R, attack_UOV.x = attack_UOV.init_field()
+
+    Oilspace = attack_UOV.RecoverOilspace(span[:2], None, None, PK_tensor, PKSymm_tensor, None, None)
+
+    for oil in Oilspace:
+        assert attack_UOV.check_oil([attack_UOV.IntToField(int(b)) for b in oil], PK_tensor) != 0
+
+
+def test_checkpoint_missing_keys_starts_from_scratch(archive, tmp_path, monkeypatch):
+    PK_tensor, _, span = archive
+    monkeypatch.setattr(attack_UOV, "w", 2, raising=False)
+    path = str(tmp_path / "checkpoint.json")
+    attack_UOV.SaveCheckpoint(path, "hash", "reconciliation", span[:3])
+    with open(path) as f:
+        state = json.load(f)
+    del state["oilspace"]
+    with open(path, "w") as f:
+        json.dump(state, f)
+
+    assert attack_UOV.LoadCheckpoint(path, "hash", PK_tensor) == ([], 2, None)
+
+
+def test_resumed_complete_checkpoint_keeps_its_stage(tmp_path, monkeypatch):
+    path = str(tmp_path / "checkpoint.json")
+    monkeypatch.setattr(attack_UOV, "profiler", profiling.StageProfiler(enabled=False))
+    assert attack_UOV.main(PK_PATH, None, checkpoint=path, candidates=ATTACK_LOG, span=True)
+    with open(path) as f:
+        state = json.load(f)
+    assert state["stage"] == "span"
+
+    state["stage"] = "reconciliation"
+    with open(path, "w") as f:
+        json.dump(state, f)
+    assert attack_UOV.main(PK_PATH, None, checkpoint=path, resume=True)
+    with open(path) as f:
+        assert json.load(f)["stage"] == "reconciliation"
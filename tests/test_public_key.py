@@ -0,0 +1,20 @@
+import os
+
+import public_key
+from conftest import REPO
+
+
+PK_PATH = os.path.join(REPO, "keys", "pk.h")
+
+
+def test_cache_entries_and_checkpoints_share_the_key_identity(tmp_path):
+    with open(PK_PATH, "rb") as f:
+        pk = public_key.parse_hex_array(f.read())
+    P = public_key.load_pk(PK_PATH)
+    cache = public_key.PublicKeyCache(str(tmp_path))
+    upper, _ = cache.load(PK_PATH)
+
+    pk_hash = public_key.key_hash(pk)
+    assert public_key.tensor_hash(P) == pk_hash
+    assert public_key.tensor_hash(upper) == pk_hash
+    assert os.listdir(tmp_path) == [pk_hash]
@@ -0,0 +1,15 @@
+import os
+
+import result_log
+import uov_verifier
+from conftest import REPO
+
+
+def test_verifies_archive_with_trailing_commas():
+    path = os.path.join(REPO, "results", "transfer-validate-300runs.json")
+    pairs = uov_verifier.archive_records(result_log.load_summary(path))
+    verifier = uov_verifier.UOVVerifier.from_file(os.path.join(REPO, "keys", "pk.h"))
+
+    assert len(pairs["nofaults"]) > 0
+    assert not verifier.verify_pairs(pairs["nofaults"]).any()
+    assert verifier.verify_pairs(pairs["faulted_sig"]).all()
@@ -0,0 +1,40 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+import verification_utils
+
+
+pytestmark = pytest.mark.skipif(
+    not os.path.exists(os.path.join(verification_utils.library_path, "validation_functions-test.so")),
+    reason="shared library not built (make shared_libs)",
+)
+
+
+def random_pairs(count, seed=0):
+    rng = np.random.default_rng(seed)
+    msgs = rng.integers(0, 256, (count, verification_utils.MSG_BYTES), dtype=np.uint8)
+    sigs = rng.integers(0, 256, (count, verification_utils.SIG_BYTES), dtype=np.uint8)
+    return [(msg.tobytes(), sig.tobytes()) for msg, sig in zip(msgs, sigs)]
+
+
+def test_concurrent_oil_calculation_matches_serial():
+    pairs = random_pairs(64)
+    serial = [verification_utils.calculate_oil(msg, sig) for msg, sig in pairs]
+
+    with verification_utils.VerificationPool(workers=8, chunk_size=4) as pool:
+        futures = [pool.submit_oil(msg, sig) for msg, sig in pairs]
+        mapped = list(pool.map_oil(pairs))
+    assert [f.result() for f in futures] == serial
+    assert mapped == serial
+
+    # batch and single calls racing each other
+    records = verification_utils.pack_records(pairs)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        batches = [executor.submit(verification_utils.calculate_oils, records) for _ in range(4)]
+        singles = list(executor.map(lambda pair: verification_utils.calculate_oil(*pair), pairs))
+    assert singles == serial
+    for batch in batches:
+        assert [oil.tobytes() for oil in batch.result()] == serial
@@ -0,0 +1,145 @@
+import argparse
+import hashlib
+import os
+import sys
+import time
+
+import numpy as np
+
+import gf256
+import public_key
+import result_log
+
+
+MSG_BYTES = 256
+SALT_BYTES = 16
+
+
+class UOVVerifier:
+    """
+    UOV signature verification in NumPy, without the validation shared library.
+
+    A signature sig = w || salt of message M is valid iff P(w) = SHAKE256(M || salt)
+    (first m bytes), where P is the public map. The public map is evaluated on whole
+    batches of signatures at once (gf256.QuadraticMap.evaluate_batch). Results use the
+    convention of verification_utils.verify_signature: `0` valid, `1` invalid.
+    """
+
+    def __init__(self, P, msg_bytes=MSG_BYTES, salt_bytes=SALT_BYTES):
+        """
+        Args:
+            P (np.ndarray): (m, n, n) uint8 public key tensor (see public_key.load_pk)
+            msg_bytes (int): Message length
+            salt_bytes (int): Salt length
+        """
+        self.public_map = gf256.QuadraticMap(P)
+        self.m = self.public_map.m
+        self.n = self.public_map.n
+        self.msg_bytes = msg_bytes
+        self.sig_bytes = self.n + salt_bytes
+        self.record_bytes = msg_bytes + self.sig_bytes
+
+    @classmethod
+    def from_file(cls, path, v=68, m=44):
+        """
+        Load the public key from a header file (e.g. `keys/pk.h`).
+        """
+        return cls(public_key.load_pk(path, v, m))
+
+    def targets(self, records):
+        """
+        Hash targets SHAKE256(M || salt) of (N, record_bytes) records msg || w || salt.
+        """
+        salt_start = self.msg_bytes + self.n
+        return np.array([
+            np.frombuffer(hashlib.shake_256(record[:self.msg_bytes].tobytes() + record[salt_start:].tobytes()).digest(self.m), dtype=np.uint8)
+            for record in records
+        ], dtype=np.uint8).reshape(-1, self.m)
+
+    def verify_records(self, records, chunk_size=16):
+        """
+        Verify N contiguous records msg || sig (same layout as verification_utils.verify_signatures).
+
+        Args:
+            records: bytes-like object or NumPy array of N * record_bytes bytes
+            chunk_size (int): Signatures evaluated at once
+
+        Returns:
+            np.ndarray: (N,) int32 results, `0` valid / `1` invalid
+        """
+        if isinstance(records, np.ndarray):
+            records = np.ascontiguousarray(records, dtype=np.uint8)
+        else:
+            records = np.frombuffer(records, dtype=np.uint8)
+        if records.size % self.record_bytes != 0:
+            raise ValueError(f"Records length {records.size} is not a multiple of {self.record_bytes}")
+        records = records.reshape(-1, self.record_bytes)
+
+        w = records[:, self.msg_bytes:self.msg_bytes + self.n]
+        values = self.public_map.evaluate_batch(w, chunk_size)
+        return (values != self.targets(records)).any(axis=1).astype(np.int32)
+
+    def verify_pairs(self, pairs, chunk_size=16):
+        """
+        Verify (msg, sig) pairs given as bytes-like objects or hex strings.
+
+        Returns:
+            np.ndarray: (N,) int32 results, `0` valid / `1` invalid
+        """
+        pairs = list(pairs)
+        records = np.empty((len(pairs), self.record_bytes), dtype=np.uint8)
+        for i, (msg, sig) in enumerate(pairs):
+            msg = bytes.fromhex(msg) if isinstance(msg, str) else bytes(msg)
+            sig = bytes.fromhex(sig) if isinstance(sig, str) else bytes(sig)
+            if len(msg) != self.msg_bytes or len(sig) != self.sig_bytes:
+                raise ValueError(f"Invalid msg/sig length {len(msg)}/{len(sig)}")
+            records[i] = np.frombuffer(msg + sig, dtype=np.uint8)
+        return self.verify_records(records, chunk_size)
+
+    def verify_signature(self, msg, sig):
+        """
+        Verify a single signature, returns `0` if valid and `1` if invalid.
+        """
+        return int(self.verify_pairs([(msg, sig)])[0])
+
+
+def archive_records(results):
+    """
+    Collect the (msg, sig) pairs of a results file of profile_target.py per result type.
+
+    Returns:
+        dict: {result type: [(msg hex, sig hex), ...]}
+    """
+    pairs = {}
+    for glitch_config in results["glitch_configs"]:
+        for result_type, entries in glitch_config["results"].items():
+            if not isinstance(entries, list):
+                continue
+            for entry in entries:
+                if not isinstance(entry, dict):
+                    continue
+                for data in entry.get("data", []):
+                    if isinstance(data, dict) and "msg" in data and "sig" in data:
+                        pairs.setdefault(result_type, []).append((data["msg"], data["sig"]))
+    return pairs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Verify the signatures of result archives with the public key (NumPy)')
+    parser.add_argument('results', nargs='+', help='Results files of profile_target.py (json)')
+    parser.add_argument('--pk', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "keys", "pk.h"), help='Path to public key file')
+    parser.add_argument('--chunk-size', type=int, default=16, help='Signatures evaluated at once')
+    args = parser.parse_args()
+
+    verifier = UOVVerifier.from_file(args.pk)
+    for path in args.results:
+        try:
+            results = result_log.load_summary(path)
+        except (OSError, ValueError) as e:
+            print(f"{path}: cannot read ({e})", file=sys.stderr)
+            continue
+
+        for result_type, pairs in archive_records(results).items():
+            start = time.time()
+            verified = verifier.verify_pairs(pairs, args.chunk_size)
+            print(f"{path} {result_type}: {int((verified == 0).sum())} valid, {int(verified.sum())} invalid of {len(pairs)} ({time.time() - start:.2f}s)")
@@ -1,10 +1,81 @@
 import os
 import ctypes
+import functools
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
+import numpy as np
+
+
+MSG_BYTES = 256
+SIG_BYTES = 128
+OIL_BYTES = 68 + 44
+RECORD_BYTES = MSG_BYTES + SIG_BYTES
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 library_path = os.path.join(current_dir, "build")
-shared_lib = ctypes.CDLL(os.path.join(library_path, "validation_functions-test.so"))
+
+# crypto_sign (ov_sign) draws a salt with randombytes before USE_SALT_FROM_SIG replaces
+# it, and the random number generator state is shared by all threads of the process.
+# All signing calls (calculate_oil, calculate_oils) are serialized with this lock
+_sign_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=None)
+def load_shared_lib():
+    """
+    Load the validation shared library on first use and configure its bindings once.
+
+    Buffers are passed as raw pointers (c_void_p), so bytes, bytearray and NumPy
+    memory reach the library without being copied.
+    """
+    shared_lib = ctypes.CDLL(os.path.join(library_path, "validation_functions-test.so"))
+
+    shared_lib.verify_signature.argtypes = [
+        ctypes.c_void_p,  # m (opened message out, 256 bytes)
+        ctypes.c_void_p,  # sm (msg || sig)
+        ctypes.c_size_t,  # smlen
+    ]
+    shared_lib.verify_signature.restype = ctypes.c_int
+
+    shared_lib.generate_faulted_sig.argtypes = [
+        ctypes.c_void_p,  # m
+        ctypes.c_void_p,  # sm (msg || zeroed signature, overwritten)
+        ctypes.c_void_p,  # salt (random if NULL)
+        ctypes.c_void_p,  # out
+    ]
+    shared_lib.generate_faulted_sig.restype = ctypes.c_int
+
+    shared_lib.verify_signatures.argtypes = [
+        ctypes.c_void_p,  # records (count * (msg || sig))
+        ctypes.c_size_t,  # count
+        ctypes.c_void_p,  # results (count * int32 out)
+    ]
+    shared_lib.verify_signatures.restype = ctypes.c_int
+
+    shared_lib.calculate_oils.argtypes = [
+        ctypes.c_void_p,  # records (count * (msg || sig))
+        ctypes.c_size_t,  # count
+        ctypes.c_void_p,  # out (count * 112 bytes)
+    ]
+    shared_lib.calculate_oils.restype = ctypes.c_int
+    return shared_lib
+
+
+def _as_array(data, length=None):
+    """
+    View bytes, bytearray, memoryview or a NumPy array as contiguous uint8 array
+    without copying (only non-contiguous or non-uint8 arrays are copied).
+    """
+    if isinstance(data, np.ndarray):
+        array = np.ascontiguousarray(data, dtype=np.uint8).reshape(-1)
+    else:
+        array = np.frombuffer(data, dtype=np.uint8)
+    if length is not None and len(array) != length:
+        raise ValueError(f"Invalid length {len(array)} (expected {length})")
+    return array
+
 
 def verify_signature(msg: bytes, sig: bytes) -> int:
     """
@@ -20,26 +91,18 @@ def verify_signature(msg: bytes, sig: bytes) -> int:
             - `1` if invalid
             - `-1` if error occurred in shared library
     """
-    if (len(msg) != 256):
+    if (len(msg) != MSG_BYTES):
         raise ValueError("Invalid msg length")
-    if (len(sig) != 128):
+    if (len(sig) != SIG_BYTES):
         raise ValueError("Invalid sig length")
 
-    sm = msg + sig
-
-    # Set argument types: pointer to unsigned char, and length
-    shared_lib.verify_signature.argtypes = [
-        ctypes.POINTER(ctypes.c_ubyte),
-        ctypes.POINTER(ctypes.c_ubyte),
-        ctypes.c_size_t
-    ]
-    shared_lib.verify_signature.restype = ctypes.c_int
-
-    msg_ctype = (ctypes.c_ubyte * len(msg)).from_buffer_copy(msg)
-    sm_ctype  = (ctypes.c_ubyte * len(sm)).from_buffer_copy(sm)
+    # the library needs msg || sig in one buffer
+    sm = np.empty(RECORD_BYTES, dtype=np.uint8)
+    sm[:MSG_BYTES] = _as_array(msg)
+    sm[MSG_BYTES:] = _as_array(sig)
+    m_out = np.empty(MSG_BYTES, dtype=np.uint8)
 
-    result = shared_lib.verify_signature(msg_ctype, sm_ctype, ctypes.c_size_t(len(sm_ctype)))
-    return result
+    return load_shared_lib().verify_signature(m_out.ctypes.data, sm.ctypes.data, RECORD_BYTES)
 
 
 def calculate_oil(msg: bytes, sig:bytes) -> bytes:
@@ -53,26 +116,154 @@ def calculate_oil(msg: bytes, sig:bytes) -> bytes:
     Returns:
         bytes: Expected oil
     """
-    if (len(msg) != 256):
+    if (len(msg) != MSG_BYTES):
         raise ValueError("Invalid msg length")
-    if (len(sig) != 128):
+    if (len(sig) != SIG_BYTES):
         raise ValueError("Invalid sig length")
 
-    shared_lib.generate_faulted_sig.argtypes = [
-        ctypes.POINTER(ctypes.c_ubyte),  # m
-        ctypes.POINTER(ctypes.c_ubyte),  # sm
-        ctypes.POINTER(ctypes.c_ubyte),  # salt (random if NULL)
-        ctypes.POINTER(ctypes.c_ubyte),  # out
-    ]
-    shared_lib.generate_faulted_sig.restype = ctypes.c_int
-    
+    msg = _as_array(msg) # use message from target
+    sig = _as_array(sig)
+    sm = np.zeros(RECORD_BYTES, dtype=np.uint8) # zeroed out signature
+    sm[:MSG_BYTES] = msg
+    sig_out = np.empty(SIG_BYTES, dtype=np.uint8)
+
+    # use salt from target signature
+    with _sign_lock:
+        load_shared_lib().generate_faulted_sig(msg.ctypes.data, sm.ctypes.data, sig[-16:].ctypes.data, sig_out.ctypes.data)
+    return sig_out[:OIL_BYTES].tobytes()
+
+
+def pack_records(pairs):
+    """
+    Pack (msg, sig) pairs into one contiguous (N, 384) record array for the batch functions.
+
+    Args:
+        pairs (iterable): (msg, sig) pairs as bytes-like objects or hex strings
+            (e.g. the `data` entries of a results file as `(d["msg"], d["sig"])`)
+
+    Returns:
+        np.ndarray: (N, 384) uint8 records msg || sig
+    """
+    pairs = list(pairs)
+    records = np.empty((len(pairs), RECORD_BYTES), dtype=np.uint8)
+    for i, (msg, sig) in enumerate(pairs):
+        if isinstance(msg, str):
+            msg = bytes.fromhex(msg)
+        if isinstance(sig, str):
+            sig = bytes.fromhex(sig)
+        records[i, :MSG_BYTES] = _as_array(msg, MSG_BYTES)
+        records[i, MSG_BYTES:] = _as_array(sig, SIG_BYTES)
+    return records
+
+
+def _as_records(records):
+    records = _as_array(records)
+    if len(records) % RECORD_BYTES != 0:
+        raise ValueError(f"Records length {len(records)} is not a multiple of {RECORD_BYTES}")
+    return records, len(records) // RECORD_BYTES
+
+
+def verify_signatures(records) -> np.ndarray:
+    """
+    Verify N signatures with one call into the shared library.
+
+    Args:
+        records: N contiguous msg || sig records (bytes-like or NumPy array, see pack_records)
+
+    Returns:
+        np.ndarray: (N,) int32 results, `0` valid / `1` invalid (as verify_signature)
+    """
+    records, count = _as_records(records)
+    results = np.empty(count, dtype=np.int32)
+    load_shared_lib().verify_signatures(records.ctypes.data, count, results.ctypes.data)
+    return results
+
+
+def calculate_oils(records) -> np.ndarray:
+    """
+    Calculate the expected oil of N signatures with one call into the shared library.
+
+    Args:
+        records: N contiguous msg || sig records (bytes-like or NumPy array, see pack_records)
+
+    Returns:
+        np.ndarray: (N, 112) uint8 expected oil (all zero where signing failed)
+    """
+    records, count = _as_records(records)
+    out = np.empty((count, OIL_BYTES), dtype=np.uint8)
+    with _sign_lock:
+        load_shared_lib().calculate_oils(records.ctypes.data, count, out.ctypes.data)
+    return out
+
+
+class VerificationPool:
+    """
+    Thread pool fanning signature checks out over several cores.
+
+    ctypes releases the GIL during foreign calls. Verification only uses its arguments
+    and stack buffers, so those calls run in parallel. Signing (the oil calculations)
+    calls randombytes and shares the random number generator state, so these calls are
+    serialized by a module-level lock and only overlap with verifications. Single checks
+    are submitted as futures, iterables of (msg, sig) pairs are processed in chunks with
+    one batch call per chunk and returned in order.
+    """
+
+    def __init__(self, workers=None, chunk_size=64):
+        """
+        Args:
+            workers (int): Number of threads (None = number of cores)
+            chunk_size (int): Records per batch call in `map` / `map_oil`
+        """
+        self.chunk_size = chunk_size
+        self.executor = ThreadPoolExecutor(max_workers=workers or os.cpu_count(), thread_name_prefix="verify")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self, cancel=False):
+        self.executor.shutdown(wait=True, cancel_futures=cancel)
+
+    def submit(self, msg, sig):
+        """
+        Returns:
+            Future: Result of verify_signature(msg, sig)
+        """
+        return self.executor.submit(verify_signature, msg, sig)
+
+    def submit_oil(self, msg, sig):
+        """
+        Returns:
+            Future: Result of calculate_oil(msg, sig)
+        """
+        return self.executor.submit(calculate_oil, msg, sig)
+
+    def _chunks(self, pairs):
+        pairs = iter(pairs)
+        while True:
+            chunk = list(itertools.islice(pairs, self.chunk_size))
+            if not chunk:
+                return
+            yield pack_records(chunk)
+
+    def map(self, pairs):
+        """
+        Verify all (msg, sig) pairs (bytes-like or hex strings).
+
+        Returns:
+            iterator: verify_signature results in the order of `pairs`
+        """
+        for results in self.executor.map(verify_signatures, self._chunks(pairs)):
+            yield from results.tolist()
 
-    msg_ctype = (ctypes.c_ubyte * len(msg)).from_buffer_copy(msg) # use message from target
-    sm_ctype = (ctypes.c_ubyte * (len(msg) + len(sig))).from_buffer_copy(msg + b'\x00' * len(sig)) # zeroed out signature
-    salt_ctype = (ctypes.c_ubyte * 16).from_buffer_copy(sig[-16:]) # use salt from target signature
-    sig_out = (ctypes.c_ubyte * len(sig))()
-    
-    shared_lib.generate_faulted_sig(msg_ctype, sm_ctype, salt_ctype, sig_out)
-    oil_out = bytes(sig_out[:68+44])
-    return bytes(oil_out)
+    def map_oil(self, pairs):
+        """
+        Calculate the expected oil of all (msg, sig) pairs (bytes-like or hex strings).
 
+        Returns:
+            iterator: calculate_oil results (bytes) in the order of `pairs`
+        """
+        for oils in self.executor.map(calculate_oils, self._chunks(pairs)):
+            yield from (oil.tobytes() for oil in oils)